@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+"""
+Load and benchmark harness for the web server and the checker.
+
+Starts a throwaway PostgreSQL cluster in a temp directory, applies the
+migrations, mints API keys, then runs the web server and drives it:
+
+  ingest_sb / ingest_lb   POST /small_biomes and /large_biomes with synthetic
+                          batches (controllable exact and seed duplicate ratio)
+  checker                 seedCheck.py on small_biomes against a stub sizeCheck
+                          with a fixed latency, until the backlog is empty or
+                          --checker-timeout runs out
+  sb_leaderboard          GET /sb_leaderboard pages
+  profile                 GET /profile
+  mixed                   large uploads in flight while leaderboard and
+                          profile reads run; latency is the reads'
+
+Each phase reports throughput, p50/p99 latency and database statements per
+row (or per request, counted with pg_stat_statements), and the whole run is
+saved as JSON. Pass --baseline with an earlier run to print the differences.
+
+Needs the PostgreSQL server binaries (initdb, pg_ctl, psql) on PATH or in
+--pg-bin, plus the web server's Python dependencies and requests.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+WEB_DIR = os.path.join(REPO_DIR, "shroom-webserver")
+CHECKER_DIR = os.path.join(REPO_DIR, "checker")
+MKPROJECT_DIR = os.path.join(REPO_DIR, "shroomin-mkproject")
+FAKE_SIZECHECK = os.path.join(BENCH_DIR, "fake_sizecheck.py")
+sys.path.insert(0, BENCH_DIR)
+from fake_sizecheck import island  # noqa: E402
+
+DB_NAME = "shroom_bench"
+DB_USER = "shroom"  # used by the server and checker; only its statements are counted
+MONITOR_USER = "bench"  # used by the harness itself
+KEY_PW = "bench"  # passphrase for the throwaway signing key
+TABLES = {"sb": "small_biomes", "lb": "large_biomes"}
+UNCHECKED = "calculated_size IS NULL AND (manual_check_needed = 0 or manual_check_needed is null)"
+COMPARED = ("rows_per_sec", "requests_per_sec", "p50_ms", "p99_ms", "statements_per_row", "statements_per_request")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+class Postgres:
+    """A private cluster in `root`, listening on localhost:port."""
+    def __init__(self, root: str, bin_dir: str):
+        self.root = root
+        self.data = os.path.join(root, "pgdata")
+        self.port = free_port()
+        self._bin = lambda name: os.path.join(bin_dir, name) if bin_dir else name
+
+    def env(self):
+        return dict(os.environ, PGHOST="localhost", PGPORT=str(self.port), PGUSER=DB_USER, PGPASSWORD="")
+
+    def start(self):
+        subprocess.run(
+            [self._bin("initdb"), "-D", self.data, "-U", DB_USER, "-A", "trust"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        options = (
+            f"-p {self.port} -c listen_addresses=localhost -c unix_socket_directories={self.root}"
+            " -c shared_preload_libraries=pg_stat_statements -c max_connections=200"
+        )
+        subprocess.run(
+            [self._bin("pg_ctl"), "-D", self.data, "-l", os.path.join(self.root, "postgres.log"), "-o", options, "-w", "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        conn = self.connect("postgres", DB_USER)
+        cur = conn.cursor()
+        cur.execute(f"CREATE DATABASE {DB_NAME}")
+        cur.execute(f"CREATE ROLE {MONITOR_USER} LOGIN SUPERUSER")
+        conn.close()
+        conn = self.connect(DB_NAME, DB_USER)
+        conn.cursor().execute("CREATE EXTENSION pg_stat_statements")
+        conn.close()
+
+    def migrate(self):
+        env = dict(self.env(), SHROOM_DB_NAME=DB_NAME, PATH=os.pathsep.join(filter(None, [self._bin(""), os.environ.get("PATH")])))
+        subprocess.run(["sh", "migrate.sh"], cwd=MKPROJECT_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    def connect(self, dbname: str = DB_NAME, user: str = MONITOR_USER):
+        conn = psycopg2.connect(host="localhost", port=self.port, dbname=dbname, user=user)
+        conn.autocommit = True
+        return conn
+
+    def stop(self):
+        subprocess.run([self._bin("pg_ctl"), "-D", self.data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+
+
+class StatementCounter:
+    """Statements the server or checker ran since the last reset()."""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def reset(self):
+        self.conn.cursor().execute("SELECT pg_stat_statements_reset()")
+
+    def count(self):
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            SELECT coalesce(sum(calls), 0) FROM pg_stat_statements s
+            JOIN pg_database d ON d.oid = s.dbid
+            JOIN pg_roles r ON r.oid = s.userid
+            WHERE d.datname = %s AND r.rolname = %s
+            """,
+            (DB_NAME, DB_USER),
+        )
+        return int(cur.fetchone()[0])
+
+
+class SeedGenerator:
+    """
+    Synthetic uploads. A row repeats an earlier row exactly with probability
+    dup_ratio, hits another point of an already used seed's island with
+    probability seed_dup_ratio, and is a new seed otherwise. Claims are within
+    5% of the island size fake_sizecheck reports.
+    """
+    def __init__(self, rng: random.Random, dup_ratio: float, seed_dup_ratio: float):
+        self.rng = rng
+        self.dup_ratio = dup_ratio
+        self.seed_dup_ratio = seed_dup_ratio
+        self.rows = []
+        self.seeds = []
+
+    def row(self):
+        r = self.rng.random()
+        if self.rows and r < self.dup_ratio:
+            return self.rng.choice(self.rows)
+        if self.seeds and r < self.dup_ratio + self.seed_dup_ratio:
+            seed = self.rng.choice(self.seeds)
+        else:
+            seed = self.rng.getrandbits(63)
+            self.seeds.append(seed)
+        x_min, x_max, z_min, z_max, area = island(seed)
+        row = (
+            seed,
+            self.rng.randint(x_min, x_max),
+            self.rng.randint(z_min, z_max),
+            int(area * self.rng.uniform(0.95, 1.05)),
+        )
+        self.rows.append(row)
+        return row
+
+    def batch(self, size: int):
+        return [self.row() for _ in range(size)]
+
+
+def mint_keys(pg: Postgres, workdir: str, users: int):
+    """
+    Create the server's signing key in workdir and `users` users, returning
+    (discord_id, api_key) pairs. Uses the server's own JWT helpers, so keys
+    are exactly what /register would hand out.
+    """
+    sys.path.insert(0, WEB_DIR)
+    os.environ["SHROOM_KEY_PW"] = KEY_PW
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import server
+        key = server.generate_key_pair()
+    finally:
+        os.chdir(cwd)
+    conn = pg.connect(user=DB_USER)
+    cur = conn.cursor()
+    keys = []
+    for i in range(users):
+        discord_id = 1000 + i
+        created_at = datetime.now(tz=timezone.utc)
+        cur.execute("INSERT INTO users (discord_id, created_at) VALUES (%s, %s)", (discord_id, created_at))
+        token = server.assemble_jwt(
+            server.encode_headers(server.get_jwt_headers()),
+            server.encode_payload(f"{discord_id}.{created_at.timestamp()}"),
+            key,
+        )
+        keys.append((discord_id, token))
+    conn.close()
+    return keys
+
+
+def start_server(pg: Postgres, workdir: str, workers: int):
+    port = free_port()
+    env = dict(
+        pg.env(),
+        SHROOM_DB_HOST="localhost",
+        SHROOM_DB_PORT=str(pg.port),
+        SHROOM_DB_NAME=DB_NAME,
+        SHROOM_DB_USER=DB_USER,
+        SHROOM_SB_TABLE_NAME=TABLES["sb"],
+        SHROOM_LB_TABLE_NAME=TABLES["lb"],
+        SHROOM_WEB_WORKERS=str(workers),
+        # The default budget of 10 per worker, so every worker count gets the
+        # same pool the server would have with one; max_connections is 200.
+        SHROOM_DB_POOL_MAX=str(10 * workers),
+        SHROOM_KEY_PW=KEY_PW,
+    )
+    if workers > 1:
+        env["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(dir=workdir, prefix="metrics-")
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--app-dir", WEB_DIR,
+         "--host", "localhost", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://localhost:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Web server exited, see {log.name}")
+        try:
+            if requests.get(url + "/thresholds", timeout=1).ok:
+                return proc, url
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"Web server didn't come up, see {log.name}")
+
+
+def drive(jobs, concurrency: int, send):
+    """Run send(session, job) for every job on `concurrency` threads; returns latencies, wall time, errors, results."""
+    local = threading.local()
+    latencies = []
+    results = []
+    errors = 0
+    lock = threading.Lock()
+
+    def run(job):
+        nonlocal errors
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.monotonic()
+        try:
+            response = send(session, job)
+            ok = response.ok
+            body = response.json() if ok else None
+        except requests.RequestException:
+            ok, body = False, None
+        elapsed = time.monotonic() - start
+        with lock:
+            latencies.append(elapsed)
+            if ok:
+                results.append(body)
+            else:
+                errors += 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(run, jobs))
+    return latencies, time.monotonic() - start, errors, results
+
+
+def latency_report(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def bench_ingest(url, mode, keys, generator, args, counter):
+    batches = [generator.batch(args.batch_rows) for _ in range(max(1, args.rows // args.batch_rows))]
+    jobs = [(keys[i % len(keys)][1], batch) for i, batch in enumerate(batches)]
+    endpoint = f"{url}/{TABLES[mode]}"
+
+    def send(session, job):
+        api_key, batch = job
+        data = [{"seed": s, "x": x, "z": z, "claimed_size": c} for s, x, z, c in batch]
+        return session.post(endpoint, json={"data": data}, headers={"api-key": api_key}, timeout=600)
+
+    counter.reset()
+    latencies, wall, errors, results = drive(jobs, args.concurrency, send)
+    statements = counter.count()
+    rows = sum(len(batch) for batch in batches)
+    return {
+        "requests": len(jobs),
+        "errors": errors,
+        "rows": rows,
+        "inserted": sum(r["inserted"] for r in results),
+        "seed_duplicates": sum(r["duplicate"] for r in results),
+        "rejected": sum(r["rejected"] for r in results),
+        "seconds": round(wall, 3),
+        "rows_per_sec": round(rows / wall, 1),
+        **latency_report(latencies),
+        "statements": statements,
+        "statements_per_row": round(statements / rows, 4),
+    }
+
+
+def bench_reads(url, path, jobs, args, counter, params):
+    def send(session, job):
+        return session.get(url + path, **params(job), timeout=60)
+
+    counter.reset()
+    latencies, wall, errors, _ = drive(jobs, args.concurrency, send)
+    statements = counter.count()
+    return {
+        "requests": len(jobs),
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "requests_per_sec": round(len(jobs) / wall, 1),
+        **latency_report(latencies),
+        "statements": statements,
+        "statements_per_request": round(statements / len(jobs), 4),
+    }
+
+
+def bench_mixed(url, keys, generator, args, counter):
+    """
+    Large small_biomes uploads on their own threads while leaderboard and
+    profile reads are driven in rounds until the uploads finish. p50/p99 are
+    the reads' latencies, i.e. what a reader sees while ingest is busy.
+    """
+    batches = [generator.batch(args.mixed_batch_rows) for _ in range(args.mixed_uploads)]
+    jobs = [(keys[i % len(keys)][1], batch) for i, batch in enumerate(batches)]
+    endpoint = f"{url}/{TABLES['sb']}"
+    uploads = {}
+
+    def send_upload(session, job):
+        api_key, batch = job
+        data = [{"seed": s, "x": x, "z": z, "claimed_size": c} for s, x, z, c in batch]
+        return session.post(endpoint, json={"data": data}, headers={"api-key": api_key}, timeout=600)
+
+    def upload():
+        uploads["latencies"], uploads["wall"], uploads["errors"], _ = drive(jobs, args.mixed_upload_concurrency, send_upload)
+
+    def send_read(session, job):
+        kind, value = job
+        if kind == "leaderboard":
+            return session.get(url + "/sb_leaderboard", params={"count": 50, "page": value}, timeout=60)
+        return session.get(url + "/profile", json={"discord_id": value}, timeout=60)
+
+    rng = random.Random(args.rng_seed)
+    counter.reset()
+    uploader = threading.Thread(target=upload, name="mixed-upload")
+    uploader.start()
+    latencies = []
+    reads = errors = 0
+    start = time.monotonic()
+    # At least one round, even if the uploads are already done.
+    while True:
+        round_jobs = [
+            ("leaderboard", rng.randint(1, 20)) if i % 2 else ("profile", rng.choice(keys)[0])
+            for i in range(args.concurrency * 10)
+        ]
+        round_latencies, _, round_errors, _ = drive(round_jobs, args.concurrency, send_read)
+        latencies += round_latencies
+        reads += len(round_jobs)
+        errors += round_errors
+        if not uploader.is_alive():
+            break
+    read_wall = time.monotonic() - start
+    uploader.join()
+    statements = counter.count()
+    rows = sum(len(batch) for batch in batches)
+    return {
+        "uploads": len(jobs),
+        "upload_errors": uploads["errors"],
+        "rows": rows,
+        "rows_per_sec": round(rows / uploads["wall"], 1),
+        "upload_p99_ms": latency_report(uploads["latencies"])["p99_ms"],
+        "requests": reads,
+        "errors": errors,
+        "requests_per_sec": round(reads / read_wall, 1),
+        **latency_report(latencies),
+        "statements": statements,
+    }
+
+
+def bench_checker(pg, workdir, args, counter, monitor):
+    table = TABLES["sb"]
+    cur = monitor.cursor()
+
+    def backlog():
+        cur.execute(f"SELECT count(*) FROM {table} WHERE {UNCHECKED}")
+        return cur.fetchone()[0]
+
+    before = backlog()
+    env = dict(
+        pg.env(),
+        SHROOM_DB_HOST="localhost",
+        SHROOM_DB_PORT=str(pg.port),
+        SHROOM_DB_NAME=DB_NAME,
+        SHROOM_DB_USER=DB_USER,
+        SHROOM_TABLE_NAME=table,
+        SHROOM_CHECKER_THREADS=str(args.checker_threads),
+        SHROOM_SEEDCHECK_BIN=FAKE_SIZECHECK,
+        SHROOM_BENCH_SIZECHECK_LATENCY=str(args.sizecheck_latency),
+        SHROOM_CHECKER_METRICS_PORT="0",
+        SHROOM_CHECKER_ARCHIVE_RANK="0",
+    )
+    counter.reset()
+    log = open(os.path.join(workdir, "checker.log"), "wb")
+    started = datetime.now(tz=timezone.utc)
+    start = time.monotonic()
+    proc = subprocess.Popen([sys.executable, "seedCheck.py"], cwd=CHECKER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        remaining = before
+        while remaining and time.monotonic() - start < args.checker_timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Checker exited, see {log.name}")
+            time.sleep(0.25)
+            remaining = backlog()
+        wall = time.monotonic() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    statements = counter.count()
+    checked = before - remaining
+    cur.execute(
+        f"""
+        SELECT
+          percentile_cont(0.5) WITHIN GROUP (ORDER BY j.runtime_ms),
+          percentile_cont(0.99) WITHIN GROUP (ORDER BY j.runtime_ms),
+          percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM j.finished_at - t.created_at)),
+          percentile_cont(0.99) WITHIN GROUP (ORDER BY extract(epoch FROM j.finished_at - t.created_at))
+        FROM checker_jobs j JOIN {table} t ON t.id = j.result_id
+        WHERE j.finished_at >= %s AND NOT j.large_biomes
+        """,
+        (started,),
+    )
+    runtime_p50, runtime_p99, wait_p50, wait_p99 = cur.fetchone()
+    return {
+        "backlog": before,
+        "rows": checked,
+        "drained": remaining == 0,
+        "seconds": round(wall, 3),
+        "rows_per_sec": round(checked / wall, 1),
+        "sizecheck_p50_ms": runtime_p50,
+        "sizecheck_p99_ms": runtime_p99,
+        # Submission to result written, including time queued behind other rows.
+        "p50_ms": None if wait_p50 is None else round(float(wait_p50) * 1000, 2),
+        "p99_ms": None if wait_p99 is None else round(float(wait_p99) * 1000, 2),
+        "statements": statements,
+        "statements_per_row": round(statements / checked, 4) if checked else None,
+    }
+
+
+def compare(current, baseline):
+    print(f"\n{'phase':<16}{'metric':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for phase, result in current["phases"].items():
+        old = baseline.get("phases", {}).get(phase)
+        if old is None:
+            continue
+        for metric in COMPARED:
+            if result.get(metric) is None or old.get(metric) is None:
+                continue
+            change = (result[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{phase:<16}{metric:<24}{old[metric]:>12}{result[metric]:>12}{change:>+9.1f}%")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="where to write the JSON results (default bench-results/<time>.json)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--pg-bin", default="", help="directory holding initdb and pg_ctl, if not on PATH")
+    parser.add_argument("--keep", action="store_true", help="keep the temp directory (database, logs) afterwards")
+    parser.add_argument("--rng-seed", type=int, default=1, help="seed for the synthetic data")
+    parser.add_argument("--rows", type=int, default=100000, help="rows uploaded per biome mode")
+    parser.add_argument("--batch-rows", type=int, default=1000, help="rows per upload request")
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="share of rows that repeat an earlier row exactly")
+    parser.add_argument("--seed-dup-ratio", type=float, default=0.05, help="share of rows that reuse an earlier seed")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--users", type=int, default=8, help="distinct uploaders")
+    parser.add_argument("--web-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--reads", type=int, default=2000, help="requests per read phase")
+    parser.add_argument("--mixed-uploads", type=int, default=8, help="uploads sent during the mixed phase")
+    parser.add_argument("--mixed-batch-rows", type=int, default=50000, help="rows per upload in the mixed phase")
+    parser.add_argument("--mixed-upload-concurrency", type=int, default=4, help="mixed phase uploads in flight at once")
+    parser.add_argument("--checker-threads", type=int, default=6)
+    parser.add_argument("--sizecheck-latency", type=float, default=0.05, help="seconds the stub sizeCheck takes per call")
+    parser.add_argument("--checker-timeout", type=float, default=60, help="seconds the checker phase may run")
+    args = parser.parse_args()
+
+    rng = random.Random(args.rng_seed)
+    root = tempfile.mkdtemp(prefix="shroom-bench-")
+    pg = Postgres(root, args.pg_bin)
+    server = None
+    results = {
+        "started_at": datetime.now(tz=timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "config": vars(args),
+        "phases": {},
+    }
+    try:
+        pg.start()
+        pg.migrate()
+        monitor = pg.connect()
+        counter = StatementCounter(monitor)
+        keys = mint_keys(pg, root, args.users)
+        server, url = start_server(pg, root, args.web_workers)
+
+        for mode in ("sb", "lb"):
+            generator = SeedGenerator(rng, args.dup_ratio, args.seed_dup_ratio)
+            results["phases"][f"ingest_{mode}"] = bench_ingest(url, mode, keys, generator, args, counter)
+            print(f"ingest_{mode}: {results['phases'][f'ingest_{mode}']}")
+
+        results["phases"]["checker"] = bench_checker(pg, root, args, counter, monitor)
+        print(f"checker: {results['phases']['checker']}")
+
+        pages = [rng.randint(1, 20) for _ in range(args.reads)]
+        results["phases"]["sb_leaderboard"] = bench_reads(
+            url, "/sb_leaderboard", pages, args, counter, lambda page: {"params": {"count": 50, "page": page}},
+        )
+        print(f"sb_leaderboard: {results['phases']['sb_leaderboard']}")
+
+        users = [rng.choice(keys)[0] for _ in range(args.reads)]
+        results["phases"]["profile"] = bench_reads(
+            url, "/profile", users, args, counter, lambda discord_id: {"json": {"discord_id": discord_id}},
+        )
+        print(f"profile: {results['phases']['profile']}")
+
+        generator = SeedGenerator(rng, args.dup_ratio, args.seed_dup_ratio)
+        results["phases"]["mixed"] = bench_mixed(url, keys, generator, args, counter)
+        print(f"mixed: {results['phases']['mixed']}")
+        monitor.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        pg.stop()
+        if args.keep:
+            print(f"Kept {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    output = args.output or os.path.join("bench-results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
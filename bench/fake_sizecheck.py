@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the sizeCheck binary used by bench.py. Takes the same arguments,
+sleeps SHROOM_BENCH_SIZECHECK_LATENCY seconds (default 0.05) to mimic the real
+search, and prints output in sizeCheck's format.
+
+Every seed has exactly one square island, derived from the seed alone, so
+bench.py can generate coordinates inside it and claims close to its size.
+"""
+import argparse
+import os
+import random
+import time
+
+
+def island(seed: int):
+    """(x_min, x_max, z_min, z_max, area) of the seed's island."""
+    rng = random.Random(seed)
+    half = rng.randint(20, 120)
+    cx = rng.randint(-20000, 20000)
+    cz = rng.randint(-20000, 20000)
+    side = 2 * half + 1
+    return cx - half, cx + half, cz - half, cz + half, side * side
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worldseed", type=int, required=True)
+    parser.add_argument("--x", type=int, required=True)
+    parser.add_argument("--z", type=int, required=True)
+    parser.add_argument("--largebiomes", default="false")
+    args = parser.parse_args()
+
+    time.sleep(float(os.getenv("SHROOM_BENCH_SIZECHECK_LATENCY", "0.05")))
+    x_min, x_max, z_min, z_max, area = island(args.worldseed)
+    if not (x_min <= args.x <= x_max and z_min <= args.z <= z_max):
+        print("Mushroom island does not exist at the given coordinates")
+        return
+    print(f"X-range: [{x_min}, {x_max}]")
+    print(f"Z-range: [{z_min}, {z_max}]")
+    print(f"Area: {area} square blocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
+import prometheus_client
+import queue
+import select
 import subprocess
 import re
 import time
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # -------------------------
 # Logging Configuration
@@ -22,14 +30,60 @@ DB_CONFIG = {
     "dbname": os.getenv("SHROOM_DB_NAME"),
     "user": os.getenv("SHROOM_DB_USER"),
     "password": os.getenv("PGPASSWORD"),
-    "host": "postgres",         # service name if running in docker-compose
-    "port": 5432,
+    "host": os.getenv("SHROOM_DB_HOST", "postgres"),  # service name if running in docker-compose
+    "port": int(os.getenv("SHROOM_DB_PORT", "5432")),
 }
 
 TABLE_NAME = os.getenv("SHROOM_TABLE_NAME")
-SEEDCHECK_BIN = "/checker/sizeCheck"  # path to your binary
-POLL_INTERVAL = 10  # seconds between DB checks
+LARGE_BIOMES = TABLE_NAME == "large_biomes"
+MODE = "large" if LARGE_BIOMES else "small"  # metrics label
+SEEDCHECK_BIN = os.getenv("SHROOM_SEEDCHECK_BIN", "/checker/sizeCheck")  # path to your binary
+POLL_INTERVAL = int(os.getenv("SHROOM_CHECKER_POLL_INTERVAL", "60"))  # fallback rescan if a NOTIFY is missed
+WORK_CHANNEL = f"{TABLE_NAME}_work"  # the web server NOTIFYs this after inserting rows
+CHECKED_CHANNEL = f"{TABLE_NAME}_checked"  # we NOTIFY this with the ids of rows we sized
 MAX_WORKERS = os.getenv("SHROOM_CHECKER_THREADS")     # number of parallel workers
+CLAIM_BATCH = int(os.getenv("SHROOM_CHECKER_BATCH", MAX_WORKERS))  # rows leased per claim
+LEASE_SECONDS = int(os.getenv("SHROOM_CHECKER_LEASE_SECONDS", "600"))  # how long a claim is held before others may retry it
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+WRITE_BATCH = int(os.getenv("SHROOM_CHECKER_WRITE_BATCH", "100"))  # results per UPDATE
+WRITE_INTERVAL = float(os.getenv("SHROOM_CHECKER_WRITE_INTERVAL", "1"))  # max seconds a result waits to be written
+ISLAND_CACHE_SIZE = int(os.getenv("SHROOM_CHECKER_CACHE_SIZE", "100000"))  # seeds whose measured islands are kept in memory
+CONTENDER_RANK = int(os.getenv("SHROOM_CHECKER_CONTENDER_RANK", "50"))  # leaderboard place a claim must beat to jump the queue
+CONTENDER_RATIO = float(os.getenv("SHROOM_CHECKER_CONTENDER_RATIO", "0.9"))  # claims are approximate, allow this much below the cutoff
+AGING_SECONDS = float(os.getenv("SHROOM_CHECKER_AGING_SECONDS", "3600"))  # waiting this long is worth one cutoff's worth of claimed size
+SCHEDULER_REFRESH = float(os.getenv("SHROOM_CHECKER_SCHEDULER_REFRESH", "30"))  # seconds between cutoff/queue depth refreshes
+ARCHIVE_TABLE = f"{TABLE_NAME}_archive"
+ARCHIVE_RANK = int(os.getenv("SHROOM_CHECKER_ARCHIVE_RANK", "100000"))  # checked rows sized below this place move to cold storage, 0 disables
+ARCHIVE_INTERVAL = float(os.getenv("SHROOM_CHECKER_ARCHIVE_INTERVAL", "3600"))  # seconds between compaction runs
+ARCHIVE_BATCH = int(os.getenv("SHROOM_CHECKER_ARCHIVE_BATCH", "10000"))  # rows moved per transaction
+METRICS_PORT = int(os.getenv("SHROOM_CHECKER_METRICS_PORT", "9101"))  # Prometheus /metrics, 0 disables
+
+# -------------------------
+# Metrics
+# -------------------------
+SIZECHECK_SECONDS = prometheus_client.Histogram(
+    "shroom_checker_sizecheck_seconds", "sizeCheck runtime", ["mode"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+CHECKS = prometheus_client.Counter(
+    "shroom_checker_checks", "Finished checks by outcome (sized, cached, manual, unparsed)", ["mode", "outcome"],
+)
+ISLAND_CACHE_LOOKUPS = prometheus_client.Counter(
+    "shroom_checker_island_cache_lookups", "Island cache lookups by result", ["mode", "result"],
+)
+RESULTS_WRITTEN = prometheus_client.Counter(
+    "shroom_checker_results_written", "Results written back, by whether the row got a size", ["mode", "sized"],
+)
+WRITE_SECONDS = prometheus_client.Histogram("shroom_checker_write_seconds", "Time to write one batch of results", ["mode"])
+BACKLOG = prometheus_client.Gauge("shroom_checker_backlog_rows", "Unchecked rows by queue", ["mode", "queue"])
+OLDEST_UNCHECKED = prometheus_client.Gauge(
+    "shroom_checker_oldest_unchecked_timestamp_seconds", "Submission time of the oldest unchecked row", ["mode"],
+)
+WORKERS = prometheus_client.Gauge("shroom_checker_workers", "Worker threads", ["mode"])
+WORKERS_BUSY = prometheus_client.Gauge("shroom_checker_workers_busy", "Worker threads running a job", ["mode"])
+WORKER_BUSY_SECONDS = prometheus_client.Counter(
+    "shroom_checker_worker_busy_seconds", "Time worker threads spent on jobs; rate / workers is utilisation", ["mode"],
+)
 
 # -------------------------
 # Run seedCheck
@@ -60,10 +114,12 @@ def run_seedcheck(seed: int, x: int, z: int, largebiomes: bool = False):
             check=True,
         )
     except subprocess.CalledProcessError as e:
+        SIZECHECK_SECONDS.labels(MODE).observe(time.time() - start_time)
         logging.error(f"Error running seedCheck: {e.stderr}")
-        return None, 0, False
+        return None, None, None, None, None, 0, False
 
     elapsed = time.time() - start_time
+    SIZECHECK_SECONDS.labels(MODE).observe(elapsed)
     logging.info(f"seedCheck completed in {elapsed:.2f} seconds")
 
     stdout = result.stdout.strip()
@@ -71,7 +127,7 @@ def run_seedcheck(seed: int, x: int, z: int, largebiomes: bool = False):
     # Detect "mushroom island does not exist" case
     if "does not exist" in stdout or "could otherwise not be measured" in stdout:
         logging.warning("Manual check needed: " + stdout)
-        return None, elapsed, True
+        return None, None, None, None, None, elapsed, True
 
     # Parse area
     x_min = 0
@@ -79,115 +135,648 @@ def run_seedcheck(seed: int, x: int, z: int, largebiomes: bool = False):
     z_min = 0
     z_max = 0
     match = re.search(r"Area:\s+(\d+)\s+square blocks", stdout)
-    x_match = re.search(r"X-range: \[+(\d+), (\d+)\]", stdout)
-    z_match = re.search(r"Z-range: \[+(\d+), (\d+)\]", stdout)
+    x_match = re.search(r"X-range: \[+(-?\d+), (-?\d+)\]", stdout)
+    z_match = re.search(r"Z-range: \[+(-?\d+), (-?\d+)\]", stdout)
     if x_match:
-        x_min = x_match.group(1)
-        x_max = x_match.group(2)
+        x_min = int(x_match.group(1))
+        x_max = int(x_match.group(2))
     if z_match:
-        z_min = z_match.group(1)
-        z_max = z_match.group(2)
+        z_min = int(z_match.group(1))
+        z_max = int(z_match.group(2))
     if match:
         return x_min, x_max, z_min, z_max, int(match.group(1)), elapsed, False
     else:
         logging.warning("Could not parse area from output:\n" + stdout)
         return None, None, None, None, None, elapsed, False
 
+# -------------------------
+# Island Cache
+# -------------------------
+class IslandCache:
+    """
+    LRU of measured islands per seed. sizeCheck's answer for (seed, x, z) is
+    fully determined by the island containing (x, z), so any point inside a
+    known bounding box can reuse that island's size and bounds.
+    """
+    def __init__(self, max_seeds: int):
+        self._islands = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_seeds = max_seeds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, seed: int, x: int, z: int):
+        with self._lock:
+            for island in self._islands.get(seed, ()):
+                x_min, x_max, z_min, z_max, area = island
+                if x_min <= x <= x_max and z_min <= z <= z_max:
+                    self._islands.move_to_end(seed)
+                    self.hits += 1
+                    ISLAND_CACHE_LOOKUPS.labels(MODE, "hit").inc()
+                    return island
+            self.misses += 1
+            ISLAND_CACHE_LOOKUPS.labels(MODE, "miss").inc()
+            return None
+
+    def add(self, seed: int, island):
+        with self._lock:
+            islands = self._islands.setdefault(seed, [])
+            if island not in islands:
+                islands.append(island)
+            self._islands.move_to_end(seed)
+            while len(self._islands) > self.max_seeds:
+                self._islands.popitem(last=False)
+
+
+island_cache = IslandCache(ISLAND_CACHE_SIZE)
+
+
 # Worker Function
 def process_row(row):
-    """Process a single DB row: run seedCheck, update DB, insert log."""
+    """Run seedCheck for a leased row and queue the outcome for the writer."""
+    start = time.monotonic()
     row_id, seed, x, z = row["id"], row["seed"], row["x"], row["z"]
     logging.info(f"Processing row {row_id} (seed={seed}, x={x}, z={z})")
-    lb = TABLE_NAME == "large_biomes"
-    x_min, x_max, z_min, z_max, area, elapsed, manual_needed = run_seedcheck(seed, x, z, lb)
+    if row["known_size"] is not None:
+        island_cache.add(seed, (row["known_min_x"], row["known_max_x"], row["known_min_z"], row["known_max_z"], row["known_size"]))
+    island = island_cache.get(seed, x, z)
+    cached = island is not None
+    elapsed = None
+    if cached:
+        x_min, x_max, z_min, z_max, area = island
+        manual_needed = False
+        logging.info(f"Row {row_id} is inside an already measured island, skipping seedCheck")
+    else:
+        x_min, x_max, z_min, z_max, area, elapsed, manual_needed = run_seedcheck(seed, x, z, LARGE_BIOMES)
+        if area is not None:
+            island_cache.add(seed, (x_min, x_max, z_min, z_max, area))
 
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            f"SELECT id FROM {TABLE_NAME} where seed = {seed} and min_x <= {x_min} and max_x >= {x_max} and min_z <= {z_min} and max_z >= {z_max}"
-        )
-        conflicting_id = None
-        if cur.rowcount > 0:
-            conflicting_id = cur.fetchone()[0]
-        cur.execute(
-            f"SELECT claimed_size FROM {TABLE_NAME} where id = {row_id}"
-        )
-        claimed_size = cur.fetchone()[0]
-        if claimed_size/area > 1.1 or claimed_size/area < 0.9:
+    gap = False
+    if area:
+        ratio = row["claimed_size"] / area
+        gap = ratio > 1.1 or ratio < 0.9
+        if gap:
             # Invalidate if the gap is too wide
-            cur.execute(
-                f"UPDATE {TABLE_NAME} SET manual_check_needed = 1 WHERE id = {row_id}"
+            logging.info(f"Invalidating row {row_id} due to gap between claimed and calculated. Claimed: {row['claimed_size']} calced: {area}")
+    elif area is None and not manual_needed:
+        # Nothing to write; the lease is kept so the row is retried once it expires.
+        logging.warning(f"Skipping row {row_id}, could not parse area.")
+
+    result_writer.put((row_id, seed, area, x_min, x_max, z_min, z_max, manual_needed, gap, cached), elapsed)
+    WORKER_BUSY_SECONDS.labels(MODE).inc(time.monotonic() - start)
+    return row_id
+
+
+# -------------------------
+# Result Writer
+# -------------------------
+def check_outcome(result, conflict):
+    """A written result's outcome; mirrors how the writer's UPDATE treats it."""
+    area, manual, gap, cached = result[2], result[7], result[8], result[9]
+    if manual or gap or conflict:
+        return "manual"
+    if area is None:
+        return "unparsed"
+    return "cached" if cached else "sized"
+
+
+# Must match the expression the island_box_idx GiST indexes are built on.
+ISLAND_BOX = "box(point({0}.min_x, {0}.min_z), point({0}.max_x, {0}.max_z))"
+
+
+class ResultWriter:
+    """
+    Collects finished checks from the worker threads and writes them back in
+    batches: one multi-row UPDATE per flush sets the size, bounds, manual flag
+    and lease release for every queued row, and detects rows whose island is
+    already covered by another row of the same seed. Each job's runtime and
+    outcome, as the statement decided it, are recorded in checker_jobs in the
+    same transaction.
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, result, runtime):
+        """Queue a result; runtime is sizeCheck's wall time, None if it wasn't run."""
+        self._queue.put((result, runtime))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_INTERVAL
+            while len(batch) < WRITE_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Leases on these rows expire and they get checked again.
+                logging.error(f"Failed to write {len(batch)} results: {e}")
+
+    def _flush(self, batch):
+        start = time.monotonic()
+        results = [result for result, _ in batch]
+        conn = self._pool.getconn()
+        discard = False
+        try:
+            cur = conn.cursor()
+            # A row is only given a size when sizeCheck measured it and no other
+            # row of the same seed, stored or earlier in this batch, already
+            # contains its bounding box; otherwise it's flagged for a manual
+            # check. A wide claimed/calculated gap flags the row but keeps the
+            # measured size. Newly sized rows are added to their owner's
+            # user_totals in the same statement; rows another checker already
+            # sized are left alone so nothing is counted twice.
+            updated = psycopg2.extras.execute_values(
+                cur,
+                f"""
+                WITH r (id, seed, area, min_x, max_x, min_z, max_z, manual, gap, cached) AS (VALUES %s),
+                v AS (SELECT r.*, {ISLAND_BOX.format("r")} AS box FROM r),
+                c AS (
+                  SELECT v.*, EXISTS (
+                    SELECT 1 FROM {TABLE_NAME} o
+                    WHERE o.seed = v.seed AND o.id <> v.id AND o.calculated_size IS NOT NULL
+                      AND {ISLAND_BOX.format("o")} @> v.box
+                  ) OR EXISTS (
+                    SELECT 1 FROM {ARCHIVE_TABLE} o
+                    WHERE o.seed = v.seed AND {ISLAND_BOX.format("o")} @> v.box
+                  ) OR EXISTS (
+                    SELECT 1 FROM v w
+                    WHERE w.seed = v.seed AND w.id < v.id AND w.area IS NOT NULL AND NOT w.manual
+                      AND w.box @> v.box
+                  ) AS conflict
+                  FROM v
+                ),
+                updated AS (
+                  UPDATE {TABLE_NAME} t SET
+                    calculated_size = CASE WHEN c.manual OR c.conflict OR c.area IS NULL THEN t.calculated_size ELSE c.area END,
+                    min_x = CASE WHEN c.manual OR c.conflict OR c.area IS NULL THEN t.min_x ELSE c.min_x END,
+                    max_x = CASE WHEN c.manual OR c.conflict OR c.area IS NULL THEN t.max_x ELSE c.max_x END,
+                    min_z = CASE WHEN c.manual OR c.conflict OR c.area IS NULL THEN t.min_z ELSE c.min_z END,
+                    max_z = CASE WHEN c.manual OR c.conflict OR c.area IS NULL THEN t.max_z ELSE c.max_z END,
+                    manual_check_needed = CASE WHEN c.manual OR c.conflict OR c.gap THEN 1 ELSE t.manual_check_needed END,
+                    measured_from_cache = c.cached,
+                    leased_until = CASE WHEN c.area IS NULL AND NOT c.manual THEN t.leased_until END,
+                    leased_by = CASE WHEN c.area IS NULL AND NOT c.manual THEN t.leased_by END
+                  FROM c
+                  WHERE t.id = c.id AND t.seed = c.seed AND t.calculated_size IS NULL
+                  RETURNING t.id, t.user_id, t.calculated_size
+                ),
+                totals AS (
+                  INSERT INTO user_totals (user_id, table_name, score, count)
+                  SELECT user_id, '{TABLE_NAME}', sum(calculated_size), count(*)
+                  FROM updated WHERE calculated_size IS NOT NULL
+                  GROUP BY user_id
+                  ON CONFLICT (user_id, table_name) DO UPDATE
+                  SET score = user_totals.score + excluded.score, count = user_totals.count + excluded.count
+                )
+                SELECT c.id, u.calculated_size IS NOT NULL, c.conflict
+                FROM c LEFT JOIN updated u ON u.id = c.id
+                """,
+                results,
+                template="(%s::int, %s::bigint, %s::int, %s::int, %s::int, %s::int, %s::int, %s::boolean, %s::boolean, %s::boolean)",
+                page_size=WRITE_BATCH,
+                fetch=True,
+            )
+            # Tell the web server which rows now have a size so it can update
+            # its leaderboard; chunked to stay under the NOTIFY payload limit.
+            sized = [str(row_id) for row_id, has_size, _ in updated if has_size]
+            conflicts = {row_id: conflict for row_id, _, conflict in updated}
+            outcomes = [check_outcome(r, conflicts.get(r[0], False)) for r in results]
+            for i in range(0, len(sized), 500):
+                cur.execute("SELECT pg_notify(%s, %s)", (CHECKED_CHANNEL, ",".join(sized[i:i + 500])))
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO checker_jobs (result_id, large_biomes, runtime_ms, cached, sized, manual) VALUES %s",
+                (
+                    (
+                        r[0], LARGE_BIOMES, None if runtime is None else round(runtime * 1000), r[9],
+                        # A wide gap flags the row but it still keeps its size.
+                        r[2] is not None and not r[7] and not conflicts.get(r[0], False), outcome == "manual",
+                    )
+                    for (r, runtime), outcome in zip(batch, outcomes)
+                ),
+                page_size=WRITE_BATCH,
             )
             conn.commit()
-            logging.info(f"Invalidated row {row_id} due to gap between claimed and calculated. Claimed: {claimed_size} calced: {area}")
-        if manual_needed or conflicting_id:
+            cur.close()
+            for outcome in outcomes:
+                CHECKS.labels(MODE, outcome).inc()
+            RESULTS_WRITTEN.labels(MODE, "true").inc(len(sized))
+            RESULTS_WRITTEN.labels(MODE, "false").inc(len(batch) - len(sized))
+            WRITE_SECONDS.labels(MODE).observe(time.monotonic() - start)
+            logging.info(f"Wrote {len(batch)} results (island cache: {island_cache.hits} hits, {island_cache.misses} misses)")
+        except psycopg2.Error:
+            discard = True
+            raise
+        finally:
+            self._pool.putconn(conn, close=discard or bool(conn.closed))
+
+
+# -------------------------
+# Compactor
+# -------------------------
+ARCHIVE_COLUMNS = """id, seed, x, z, claimed_size, calculated_size, duplicate_seed_flag,
+    manual_check_needed, user_id, created_at, min_x, min_z, max_x, max_z, measured_from_cache"""
+
+
+class Compactor:
+    """
+    Every ARCHIVE_INTERVAL seconds, moves checked rows sized below the
+    ARCHIVE_RANK-th place on the leaderboard into ARCHIVE_TABLE, keeping the
+    hot table and its indexes small. Rows tied with the cutoff stay, so every
+    rank above it is unaffected. Each batch is a single DELETE ... INSERT
+    statement, and SKIP LOCKED lets several checkers on a table run at once.
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        self._thread = threading.Thread(target=self._run, name="compactor", daemon=True)
+
+    def start(self):
+        if ARCHIVE_RANK > 0:
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(ARCHIVE_INTERVAL)
+            try:
+                self.compact()
+            except Exception as e:
+                logging.error(f"Compaction of {TABLE_NAME} failed: {e}")
+
+    def compact(self):
+        conn = self._pool.getconn()
+        discard = False
+        try:
+            cur = conn.cursor()
             cur.execute(
-                f"UPDATE {TABLE_NAME} SET manual_check_needed = 1 WHERE id = %s",
-                (row_id,),
+                f"""
+                SELECT calculated_size FROM {TABLE_NAME}
+                WHERE calculated_size IS NOT NULL
+                ORDER BY calculated_size DESC
+                OFFSET %s LIMIT 1
+                """,
+                (ARCHIVE_RANK,),
             )
+            row = cur.fetchone()
             conn.commit()
-            logging.info(f"Marked row {row_id} as manual_check_needed=1")
+            if row is None:
+                return
+            cutoff = row[0]
+            total = 0
+            start = time.monotonic()
+            while True:
+                cur.execute(
+                    f"""
+                    WITH doomed AS (
+                      SELECT id, seed FROM {TABLE_NAME}
+                      WHERE calculated_size IS NOT NULL AND calculated_size < %s
+                      LIMIT %s
+                      FOR UPDATE SKIP LOCKED
+                    ), moved AS (
+                      DELETE FROM {TABLE_NAME} t
+                      USING doomed d
+                      WHERE t.id = d.id AND t.seed = d.seed
+                      RETURNING t.*
+                    ), archived AS (
+                      INSERT INTO {ARCHIVE_TABLE} ({ARCHIVE_COLUMNS})
+                      SELECT {ARCHIVE_COLUMNS} FROM moved
+                    )
+                    SELECT count(*) FROM moved
+                    """,
+                    (cutoff, ARCHIVE_BATCH),
+                )
+                moved = cur.fetchone()[0]
+                conn.commit()
+                total += moved
+                if moved < ARCHIVE_BATCH:
+                    break
+            cur.close()
+            if total:
+                logging.info(f"Archived {total} rows sized below {cutoff} in {time.monotonic() - start:.1f}s")
+        except psycopg2.Error:
+            discard = True
+            raise
+        finally:
+            self._pool.putconn(conn, close=discard or bool(conn.closed))
 
-        elif area is not None:
-            cur.execute(
-                f"UPDATE {TABLE_NAME} SET calculated_size = %s WHERE id = %s",
-                (area, row_id),
+
+db_pool = None
+result_writer = None
+
+
+# -------------------------
+# Work Queue
+# -------------------------
+UNCHECKED = "calculated_size IS NULL AND (manual_check_needed = 0 or manual_check_needed is null)"
+CLAIMABLE = UNCHECKED + " AND (leased_until IS NULL OR leased_until < now())"
+
+
+class Scheduler:
+    """
+    Decides which unchecked rows this worker leases next.
+
+    Rows whose claim is within CONTENDER_RATIO of the CONTENDER_RANK-th place on
+    the leaderboard are leaderboard contenders and always go first, biggest
+    claim first. Remaining slots are shared out round-robin between submitters,
+    least-served user first, so one large upload can't starve everyone else.
+    Within a user, rows are ranked by claimed size relative to the cutoff plus
+    one point per AGING_SECONDS spent waiting, so old small claims still get
+    their turn.
+    """
+    def __init__(self):
+        self.cutoff = None
+        self.depths = {"contender": 0, "normal": 0}
+        self.users = []
+        self.served = {}
+        self._refreshed_at = 0.0
+        self._stale = True
+
+    def invalidate(self):
+        """New work arrived; pick up new users on the next claim."""
+        self._stale = True
+
+    def refresh(self, cur):
+        """
+        Re-read the leaderboard cutoff and backlog shape every SCHEDULER_REFRESH
+        seconds, or sooner (but at most once a second) after invalidate().
+        """
+        age = time.monotonic() - self._refreshed_at
+        if age < SCHEDULER_REFRESH and not (self._stale and age >= 1):
+            return
+        cur.execute(
+            f"""
+            SELECT calculated_size FROM {TABLE_NAME}
+            WHERE calculated_size IS NOT NULL
+            ORDER BY calculated_size DESC
+            OFFSET %s LIMIT 1
+            """,
+            (CONTENDER_RANK - 1,),
+        )
+        row = cur.fetchone()
+        self.cutoff = row[0] * CONTENDER_RATIO if row else None
+        cur.execute(
+            f"""
+            SELECT user_id,
+              count(*) FILTER (WHERE claimed_size >= %s),
+              count(*) FILTER (WHERE claimed_size < %s),
+              extract(epoch FROM min(created_at))
+            FROM {TABLE_NAME}
+            WHERE {UNCHECKED}
+            GROUP BY user_id
+            """,
+            (self.contender_threshold(), self.contender_threshold()),
+        )
+        per_user = cur.fetchall()
+        self.depths = {
+            "contender": sum(r[1] for r in per_user),
+            "normal": sum(r[2] for r in per_user),
+        }
+        self.users = [r[0] for r in per_user if r[2] > 0]
+        BACKLOG.labels(MODE, "contender").set(self.depths["contender"])
+        BACKLOG.labels(MODE, "normal").set(self.depths["normal"])
+        # No backlog reads as "oldest row submitted just now".
+        OLDEST_UNCHECKED.labels(MODE).set(min((float(r[3]) for r in per_user), default=time.time()))
+        floor = min((self.served.get(u, 0) for u in self.users), default=0)
+        # New users start level with the least-served one instead of at zero,
+        # which would hand them every slot until they caught up.
+        self.served = {u: max(self.served.get(u, 0), floor) for u in self.users}
+        self._refreshed_at = time.monotonic()
+        self._stale = False
+        logging.info(
+            f"Queue depth: {self.depths['contender']} contender, {self.depths['normal']} normal "
+            f"across {len(self.users)} users (cutoff={self.cutoff})"
+        )
+
+    def contender_threshold(self):
+        # No leaderboard yet means nothing can be told apart as a contender.
+        return self.cutoff if self.cutoff is not None else 2**31 - 1
+
+    def shares(self, slots: int):
+        """Split slots between backlog users round-robin, least served first."""
+        order = sorted(self.users, key=lambda u: self.served.get(u, 0))
+        shares = {}
+        if order:
+            for i in range(slots):
+                user = order[i % len(order)]
+                shares[user] = shares.get(user, 0) + 1
+        return shares
+
+    def claim(self, conn, limit: int):
+        """Lease up to `limit` rows, contenders first, then fair-share by user."""
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            self.refresh(cur)
+            conn.commit()
+            rows = self._lease(
+                cur,
+                f"""
+                SELECT id, seed FROM {TABLE_NAME}
+                WHERE {CLAIMABLE} AND claimed_size >= %s
+                ORDER BY claimed_size DESC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (self.contender_threshold(), limit),
             )
             conn.commit()
-            cur.execute(
-                f"UPDATE {TABLE_NAME} SET min_x = {x_min}, min_z = {z_min}, max_x = {x_max}, max_z = {z_max} WHERE id = {row_id}"
+            shares = self.shares(limit - len(rows))
+            if shares:
+                rows += self._lease(
+                    cur,
+                    f"""
+                    SELECT c.id, c.seed
+                    FROM unnest(%s::int[], %s::int[]) AS u(user_id, share)
+                    CROSS JOIN LATERAL (
+                      SELECT cand.id, cand.seed FROM (
+                        (SELECT id, seed, claimed_size, created_at FROM {TABLE_NAME}
+                         WHERE user_id = u.user_id AND {CLAIMABLE}
+                         ORDER BY claimed_size DESC LIMIT u.share)
+                        UNION
+                        (SELECT id, seed, claimed_size, created_at FROM {TABLE_NAME}
+                         WHERE user_id = u.user_id AND {CLAIMABLE}
+                         ORDER BY id LIMIT u.share)
+                      ) cand
+                      ORDER BY cand.claimed_size::float / %s
+                        + extract(epoch FROM now() - cand.created_at) / %s DESC
+                      LIMIT u.share
+                    ) c
+                    """,
+                    (list(shares), list(shares.values()), max(self.cutoff or 1, 1), AGING_SECONDS),
+                )
+                conn.commit()
+            if len(rows) < limit:
+                # Users in the snapshot ran dry; don't leave slots idle while
+                # others still have a backlog.
+                self.invalidate()
+                rows += self._lease(
+                    cur,
+                    f"""
+                    SELECT id, seed FROM {TABLE_NAME}
+                    WHERE {CLAIMABLE}
+                    ORDER BY claimed_size DESC
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (limit - len(rows),),
+                )
+                conn.commit()
+        finally:
+            cur.close()
+        for row in rows:
+            self.served[row["user_id"]] = self.served.get(row["user_id"], 0) + 1
+        return rows
+
+    def _lease(self, cur, picked_sql: str, params):
+        """
+        Lease the rows selected by picked_sql and return them.
+
+        SKIP LOCKED lets several checkers claim concurrently without blocking on
+        or double-claiming each other's rows, and the claimable condition is
+        re-checked once the row is locked. A row whose lease ran out (its
+        checker died or restarted mid-batch) is claimable again. Each row comes
+        back with the size and bounds of an already measured island of the same
+        seed that contains its coordinates, if there is one (known_* columns,
+        else NULL); archived islands count too. Rows are matched on (id, seed) so a table partitioned by
+        seed only touches the partition each row lives in.
+        """
+        cur.execute(
+            f"""
+            WITH picked AS ({picked_sql}),
+            claim AS (
+              SELECT id, seed FROM {TABLE_NAME}
+              WHERE (id, seed) IN (SELECT id, seed FROM picked) AND {CLAIMABLE}
+              FOR UPDATE SKIP LOCKED
+            ), leased AS (
+              UPDATE {TABLE_NAME} t
+              SET leased_until = now() + make_interval(secs => %s), leased_by = %s
+              FROM claim
+              WHERE t.id = claim.id AND t.seed = claim.seed
+              RETURNING t.id, t.seed, t.x, t.z, t.claimed_size, t.user_id
             )
-            logging.info(f"Updated row {row_id} with area={area}")
+            SELECT l.*, k.calculated_size AS known_size,
+              k.min_x AS known_min_x, k.max_x AS known_max_x,
+              k.min_z AS known_min_z, k.max_z AS known_max_z
+            FROM leased l
+            LEFT JOIN LATERAL (
+              (SELECT calculated_size, min_x, max_x, min_z, max_z FROM {TABLE_NAME} k
+               WHERE k.seed = l.seed AND k.calculated_size IS NOT NULL
+                 AND {ISLAND_BOX.format("k")} @> box(point(l.x, l.z), point(l.x, l.z))
+               LIMIT 1)
+              UNION ALL
+              (SELECT calculated_size, min_x, max_x, min_z, max_z FROM {ARCHIVE_TABLE} k
+               WHERE k.seed = l.seed AND {ISLAND_BOX.format("k")} @> box(point(l.x, l.z), point(l.x, l.z))
+               LIMIT 1)
+              LIMIT 1
+            ) k ON true
+            """,
+            tuple(params) + (LEASE_SECONDS, WORKER_ID),
+        )
+        return cur.fetchall()
 
-        else:
-            logging.warning(f"Skipping row {row_id}, could not parse area.")
-    finally:
-        cur.close()
-        conn.close()
 
-    return row_id
+scheduler = Scheduler()
+
+
+def listen_for_work():
+    """Open an autocommit connection LISTENing on WORK_CHANNEL."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    cur = conn.cursor()
+    cur.execute(f'LISTEN "{WORK_CHANNEL}"')
+    cur.close()
+    return conn
+
+
+def finish_row(future, row):
+    try:
+        row_id = future.result()
+        logging.info(f"Finished processing row {row_id}")
+    except Exception as e:
+        logging.error(f"Error processing row {row['id']}: {e}")
 
 
 # Main Worker Loop
 def main():
-    logging.info("Starting parallel seedCheck worker...")
+    """
+    Keep every worker busy: whenever a slot frees up, lease another row.
 
-    while True:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    When the queue is empty the loop blocks until the web server NOTIFYs new
+    work or a running job finishes, falling back to a rescan every
+    POLL_INTERVAL seconds in case a notification was missed.
+    """
+    global db_pool, result_writer
+    logging.info(f"Starting parallel seedCheck worker {WORKER_ID}...")
+    workers = int(MAX_WORKERS)
+    if METRICS_PORT:
+        prometheus_client.start_http_server(METRICS_PORT)
+    WORKERS.labels(MODE).set(workers)
+    # One connection each for claiming, the result writer and the compactor.
+    db_pool = psycopg2.pool.ThreadedConnectionPool(1, 3, **DB_CONFIG)
+    result_writer = ResultWriter(db_pool)
+    result_writer.start()
+    Compactor(db_pool).start()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = set()
+    # Finished jobs write to this pipe so select() wakes on them as well as on NOTIFY.
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
 
+    def on_done(future):
+        in_flight.discard(future)
+        WORKERS_BUSY.labels(MODE).set(len(in_flight))
         try:
-            # Fetch rows that need processing
-            cur.execute(
-                f"SELECT id, seed, x, z FROM {TABLE_NAME} WHERE calculated_size IS NULL AND (manual_check_needed = 0 or manual_check_needed is null) ORDER BY CLAIMED_SIZE DESC"
-            )
-            rows = cur.fetchall()
-
-            if not rows:
-                logging.info("No rows to process. Sleeping...")
-                time.sleep(POLL_INTERVAL)
-                continue
-
-            logging.info(f"Found {len(rows)} rows to process. Dispatching...")
-
-            # Process rows in parallel
-            with ThreadPoolExecutor(max_workers=int(MAX_WORKERS)) as executor:
-                futures = {executor.submit(process_row, row): row for row in rows}
-                for future in as_completed(futures):
-                    row = futures[future]
-                    try:
-                        row_id = future.result()
-                        logging.info(f"Finished processing row {row_id}")
-                    except Exception as e:
-                        logging.error(f"Error processing row {row['id']}: {e}")
+            os.write(wake_w, b"x")
+        except BlockingIOError:
+            pass  # pipe already full, the loop will wake anyway
 
-        finally:
-            cur.close()
-            conn.close()
+    conn = listen_conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = db_pool.getconn()
+                listen_conn = listen_for_work()
+
+            free = workers - len(in_flight)
+            if free > 0:
+                rows = scheduler.claim(conn, min(free, CLAIM_BATCH))
+                if rows:
+                    logging.info(f"Leased {len(rows)} rows for {LEASE_SECONDS}s. Dispatching...")
+                for row in rows:
+                    future = executor.submit(process_row, row)
+                    future.add_done_callback(lambda f, row=row: finish_row(f, row))
+                    in_flight.add(future)
+                    future.add_done_callback(on_done)
+                WORKERS_BUSY.labels(MODE).set(len(in_flight))
+                if not in_flight:
+                    logging.info("No rows to process. Waiting for new work...")
 
-        # Sleep before next poll
-        time.sleep(POLL_INTERVAL)
+            ready, _, _ = select.select([listen_conn, wake_r], [], [], POLL_INTERVAL)
+            if wake_r in ready:
+                os.read(wake_r, 4096)
+            if listen_conn in ready:
+                listen_conn.poll()
+                if listen_conn.notifies:
+                    scheduler.invalidate()
+                listen_conn.notifies.clear()
+        except psycopg2.Error as e:
+            logging.error(f"Database error in worker loop: {e}")
+            if conn is not None:
+                db_pool.putconn(conn, close=True)
+            if listen_conn is not None:
+                listen_conn.close()
+            conn = listen_conn = None
+            time.sleep(5)
 
 
 if __name__ == "__main__":
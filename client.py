@@ -1,72 +1,207 @@
 import time
-import json
+import gzip
+import hashlib
+import os
+import random
+import struct
 import requests
 import sys
 
 # Configuration
 SEEDS_FILE = "output.txt"
 SERVER_URL = "https://shroomweb.0xa.pw"  # Change to your server URL
-POLL_INTERVAL = 5  # seconds between checks
+POLL_INTERVAL = 1  # seconds between checks for new lines
+BATCH_ROWS = 10000  # send as soon as this many rows are waiting
+BATCH_SECONDS = 5  # or once the oldest waiting row is this old
+MAX_BACKOFF = 300  # seconds, upper bound between retries of a failed send
+THRESHOLD_REFRESH = 300  # seconds between fetches of the server's minimum claim
+RECENT_FILTER_BITS = 2**25  # bits per generation of the recently-sent filter (4 MiB)
+RECENT_FILTER_CAPACITY = 1000000  # rows per generation; keeps false drops around 1 in 50000
 API_KEY = sys.argv[1]
 SMALL_BIOMES = sys.argv[2]
+THRESHOLDS_URL = SERVER_URL + "/thresholds"
+MODE = "sb" if SMALL_BIOMES == "sb" else "lb"
 if(SMALL_BIOMES == "sb"):
-    SERVER_URL += "/small_biomes"
+    SERVER_URL += "/small_biomes/stream"
 else:
-    SERVER_URL += "/large_biomes"
+    SERVER_URL += "/large_biomes/stream"
+# Byte offset into SEEDS_FILE of the first line not yet accepted by the server
+CHECKPOINT_FILE = f"{SEEDS_FILE}.{MODE}.offset"
+PACKED_ROW = struct.Struct("<4q")  # seed, x, z, claimed_size as the server's packed format expects
 header = {
-    'api-key': API_KEY
+    'api-key': API_KEY,
+    'Content-Type': 'application/octet-stream',
+    'Content-Encoding': 'gzip',
 }
+
 def parse_line(line):
-    """Parse a line into a dictionary with seed, x, z, claimed_size."""
+    """Parse a line into a (seed, x, z, claimed_size) tuple."""
     parts = line.strip().split()
     if len(parts) != 4:
         return None
     try:
-        return {
-            "seed": int(parts[0]),
-            "x": int(parts[1]),
-            "z": int(parts[2]),
-            "claimed_size": int(parts[3]),
-        }
+        return (int(parts[0]), int(parts[1]), int(parts[2]), int(parts[3]))
     except ValueError:
         return None
 
+class RecentFilter:
+    """
+    Bloom filter over recently sent (seed, x, z) tuples, so rows the GPU
+    program reports twice aren't uploaded twice. Two generations of
+    RECENT_FILTER_CAPACITY rows are kept; when the current one fills up the
+    older one is dropped, which bounds memory and the false positive rate.
+    """
+    HASHES = 6
+
+    def __init__(self, bits, capacity):
+        self.bits = bits
+        self.capacity = capacity
+        self.current = bytearray(bits // 8)
+        self.previous = bytearray(bits // 8)
+        self.count = 0
+
+    def _positions(self, seed, x, z):
+        digest = hashlib.blake2b(struct.pack("<3q", seed, x, z), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.HASHES)]
+
+    @staticmethod
+    def _contains(generation, positions):
+        return all(generation[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def check_and_add(self, seed, x, z):
+        """True if the tuple was (probably) seen recently; records it either way."""
+        positions = self._positions(seed, x, z)
+        if self._contains(self.current, positions) or self._contains(self.previous, positions):
+            return True
+        if self.count >= self.capacity:
+            self.previous, self.current = self.current, bytearray(self.bits // 8)
+            self.count = 0
+        for p in positions:
+            self.current[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        return False
+
+class Thresholds:
+    """Minimum claim worth uploading for our biome mode, refreshed from the server."""
+    def __init__(self):
+        self.min_claim = 0
+        self.fetched_at = None
+
+    def refresh(self, session):
+        if self.fetched_at is not None and time.monotonic() - self.fetched_at < THRESHOLD_REFRESH:
+            return
+        try:
+            response = session.get(THRESHOLDS_URL, timeout=10)
+            if response.status_code == 200:
+                min_claim = response.json()[MODE]["min_claim"]
+                if min_claim != self.min_claim:
+                    print(f"Minimum claim is now {min_claim}")
+                self.min_claim = min_claim
+        except (requests.RequestException, ValueError, KeyError) as e:
+            # Keep filtering with the last known value.
+            print(f"Could not fetch thresholds: {e}")
+        self.fetched_at = time.monotonic()
+
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, "r") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def save_checkpoint(offset):
+    # Write then rename so a crash never leaves a half-written checkpoint.
+    with open(CHECKPOINT_FILE + ".tmp", "w") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(CHECKPOINT_FILE + ".tmp", CHECKPOINT_FILE)
+
+def read_rows(offset, max_rows):
+    """
+    Read up to max_rows complete lines starting at byte offset and return the
+    parsed rows and the offset just past the last line read. A trailing line
+    without a newline is still being written and is left for next time.
+    """
+    if os.path.getsize(SEEDS_FILE) < offset:
+        print(f"{SEEDS_FILE} shrank below the checkpoint, starting from the beginning")
+        offset = 0
+    rows = []
+    with open(SEEDS_FILE, "rb") as f:
+        f.seek(offset)
+        while len(rows) < max_rows:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            parsed = parse_line(line.decode("utf-8", "replace"))
+            if parsed:
+                rows.append(parsed)
+    return rows, offset
+
+def send_batch(session, rows):
+    """POST rows until the server accepts them, backing off between failures."""
+    body = gzip.compress(b"".join(PACKED_ROW.pack(*row) for row in rows))
+    delay = 1
+    while True:
+        try:
+            response = session.post(SERVER_URL, headers=header, data=body, timeout=60)
+            if response.status_code == 200:
+                result = response.json()
+                print(f"Sent {len(rows)} rows: {result.get('inserted')} inserted, "
+                      f"{result.get('duplicate')} seed duplicates, {result.get('rejected')} rejected")
+                return True
+            if response.status_code == 401:
+                sys.exit(f"Server rejected the API key: {response.text}")
+            if response.status_code < 500 and response.status_code not in (408, 429):
+                # Retrying won't change the answer; skip the batch rather than stall forever.
+                print(f"Server refused batch of {len(rows)} rows: {response.status_code} {response.text}")
+                return False
+            print(f"Server error {response.status_code}, retrying in {delay}s")
+        except requests.RequestException as e:
+            print(f"Error sending data: {e}, retrying in {delay}s")
+        time.sleep(delay + random.uniform(0, delay / 2))
+        delay = min(delay * 2, MAX_BACKOFF)
+
 def main():
-    last_position = 0
     print("Starting shroomin' client...")
+    session = requests.Session()  # keeps the TLS connection open between batches
+    thresholds = Thresholds()
+    recent = RecentFilter(RECENT_FILTER_BITS, RECENT_FILTER_CAPACITY)
+    dropped = 0
+    pending = []
+    pending_end = load_checkpoint()
+    first_pending_at = None
     while True:
         try:
-            print("Opening file...")
-            with open(SEEDS_FILE, "r") as f:
-                f.seek(last_position)
-                new_lines = f.readlines()
-                last_position = f.tell()
-            print(f"File opened. {len(new_lines)} entries.")
-            if new_lines:
-
-                parsed_data = []
-                for line in new_lines:
-                    parsed = parse_line(line)
-                    if parsed:
-                        parsed_data.append(parsed)
-                    if len(parsed_data) == 10000 or len(new_lines) < 10000:
-                        payload = {"data": parsed_data}
-                        print("Sending payload:", json.dumps(payload, indent=2))
-                        try:
-                            response = requests.post(
-                                SERVER_URL,
-                                headers=header,
-                                json=payload,
-                                timeout=10
-                            )
-                            print("Server response:", response.status_code, response.text)
-                        except requests.RequestException as e:
-                            print("Error sending data:", e)
-                        parsed_data = []
+            rows, pending_end = read_rows(pending_end, BATCH_ROWS - len(pending))
         except FileNotFoundError:
             print(f"File {SEEDS_FILE} not found. Waiting...")
-        
+            time.sleep(POLL_INTERVAL)
+            continue
+        thresholds.refresh(session)
+        kept = [
+            row for row in rows
+            if row[3] >= thresholds.min_claim and not recent.check_and_add(row[0], row[1], row[2])
+        ]
+        dropped += len(rows) - len(kept)
+        if kept and not pending:
+            first_pending_at = time.monotonic()
+        pending += kept
+
+        full = len(pending) >= BATCH_ROWS
+        due = pending and time.monotonic() - first_pending_at >= BATCH_SECONDS
+        if full or due:
+            if dropped:
+                print(f"Skipped {dropped} rows below the minimum claim or already sent")
+                dropped = 0
+            send_batch(session, pending)
+            save_checkpoint(pending_end)
+            pending = []
+            continue
         time.sleep(POLL_INTERVAL)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
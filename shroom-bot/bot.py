@@ -1,22 +1,173 @@
+import aiohttp
 import discord
 import subprocess
 import re
 import asyncio
-import json
-import requests
 import time
 import os
+from collections import OrderedDict
+
+SHROOM_WEB_URL = "https://shroomweb.0xa.pw"
+HTTP_TIMEOUT = 10  # seconds per web server request
+LEADERBOARD_TTL = float(os.getenv("SHROOM_BOT_LEADERBOARD_TTL", "30"))  # seconds a fetched leaderboard is reused
+SIZECHECK_WORKERS = int(os.getenv("SHROOM_BOT_SIZECHECK_WORKERS", "2"))  # sizeCheck processes run at once
+SIZECHECK_QUEUE_MAX = int(os.getenv("SHROOM_BOT_SIZECHECK_QUEUE_MAX", "50"))  # checks allowed to wait for a worker
+SIZECHECK_PER_USER = int(os.getenv("SHROOM_BOT_SIZECHECK_PER_USER", "2"))  # checks one user may have queued or running
+SIZECHECK_CACHE_SIZE = int(os.getenv("SHROOM_BOT_SIZECHECK_CACHE_SIZE", "1000"))  # recent results answered without a run
+QUEUE_STATUS_INTERVAL = 2  # seconds between queue position updates
 
 
 class MyClient(discord.Client):
+    async def setup_hook(self):
+        # One pooled session for every call to the web server, so requests
+        # reuse connections and never block the gateway loop.
+        self.web = aiohttp.ClientSession(
+            base_url=SHROOM_WEB_URL,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+        size_checks.start()
+
+    async def close(self):
+        await self.web.close()
+        await super().close()
+
     async def on_ready(self):
         print(f"Logged on as {self.user}!")
 
+
+class LeaderboardCache:
+    """
+    Leaderboard responses per (count, largebiomes), reused for LEADERBOARD_TTL
+    seconds. Callers asking while a fetch is in flight wait for that fetch
+    instead of starting their own, so a burst of /leaderboard commands costs
+    one request. Failed fetches aren't cached.
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._pending = {}
+
+    async def get(self, session: aiohttp.ClientSession, count: int, largebiomes: bool):
+        key = (count, largebiomes)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._fetch(session, key))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, session: aiohttp.ClientSession, key):
+        count, largebiomes = key
+        endpoint = "/lb_leaderboard" if largebiomes else "/sb_leaderboard"
+        async with session.get(endpoint, params={"count": count}) as response:
+            response.raise_for_status()
+            data = await response.json()
+        self._entries[key] = (time.monotonic() + self.ttl, data)
+        return data
+
 intents = discord.Intents.all()
 client = MyClient(intents=intents)
 tree = discord.app_commands.CommandTree(client)
 
-user_shroom_running = []
+class QueueLimit(Exception):
+    pass
+
+
+class SizeCheckQueue:
+    """
+    Runs /shroom's sizeCheck calls on SIZECHECK_WORKERS worker tasks, first
+    come first served. Identical (seed, x, z, largebiomes) requests share one
+    run, the last SIZECHECK_CACHE_SIZE successful results are answered
+    straight away, and submit() refuses new work past SIZECHECK_QUEUE_MAX
+    waiting checks or SIZECHECK_PER_USER checks for one user.
+    """
+    def __init__(self, workers: int, max_waiting: int, per_user: int, cache_size: int):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.per_user = per_user
+        self.cache_size = cache_size
+        self._queue = asyncio.Queue()
+        self._waiting = []  # keys in queue order, for positions
+        self._jobs = {}  # key -> (future, users waiting on it)
+        self._per_user = {}
+        self._cache = OrderedDict()
+
+    def start(self):
+        for _ in range(self.workers):
+            asyncio.ensure_future(self._work())
+
+    def submit(self, user_id: int, key):
+        """Return a future for key's (returncode, stdout, stderr)."""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(self._cache[key])
+            return future
+        job = self._jobs.get(key)
+        if job is not None and user_id in job[1]:
+            return job[0]
+        if self._per_user.get(user_id, 0) >= self.per_user:
+            raise QueueLimit(f"You already have {self.per_user} checks running, wait for one to finish.")
+        if job is None:
+            if len(self._waiting) >= self.max_waiting:
+                raise QueueLimit("The queue is full, try again in a bit.")
+            job = self._jobs[key] = (asyncio.get_running_loop().create_future(), set())
+            self._waiting.append(key)
+            self._queue.put_nowait(key)
+        job[1].add(user_id)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return job[0]
+
+    def position(self, key):
+        """1-based place in the queue, 0 once a worker has it."""
+        try:
+            return self._waiting.index(key) + 1
+        except ValueError:
+            return 0
+
+    async def _work(self):
+        while True:
+            key = await self._queue.get()
+            self._waiting.remove(key)
+            future, users = self._jobs[key]
+            try:
+                result = await run_size_check(*key)
+                if result[0] == 0:
+                    self._cache[key] = result
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                del self._jobs[key]
+                for user_id in users:
+                    self._per_user[user_id] -= 1
+                    if not self._per_user[user_id]:
+                        del self._per_user[user_id]
+
+
+async def run_size_check(worldseed: str, x: int, z: int, largebiomes: bool):
+    cmd = [
+        "./sizeCheck",
+        "--worldseed", worldseed,
+        "--x", str(x),
+        "--z", str(z),
+        "--largebiomes", str(largebiomes)
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode, stdout.decode().strip(), stderr.decode().strip()
+
+
+size_checks = SizeCheckQueue(SIZECHECK_WORKERS, SIZECHECK_QUEUE_MAX, SIZECHECK_PER_USER, SIZECHECK_CACHE_SIZE)
+leaderboard_cache = LeaderboardCache(LEADERBOARD_TTL)
 shroom_api_key = os.getenv("SHROOM_BOT_API_KEY")
 shroom_discord_token = os.getenv("SHROOM_BOT_DISCORD_TOKEN")
 
@@ -30,20 +181,16 @@ async def leaderboard(
     count: int = 10,
     largebiomes: bool = False
 ):
-    endpoint = "https://shroomweb.0xa.pw/sb_leaderboard"
-    if largebiomes:
-        endpoint = "https://shroomweb.0xa.pw/lb_leaderboard"
     limit = count
     if limit > 20:
         limit = 20
 
-    params = {
-        'count': limit
-    }
-    response = requests.get(endpoint, params, timeout=10)
+    try:
+        json_response = await leaderboard_cache.get(client.web, limit, largebiomes)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        json_response = None
     message = "`Position, User, Seed, Claimed_size, calculated_size, result_id`\n"
-    if(response.status_code == 200):
-        json_response = json.loads(response.content)
+    if json_response is not None:
         for x in range(1, limit+1):
             message += f"{x}: <@{json_response[str(x)]['discord_id']}> `{json_response[str(x)]['seed']}, {json_response[str(x)]['claimed_size']}, {json_response[str(x)]['calculated_size']}, {json_response[str(x)]['result_id']}`\n"
         message += "\n"
@@ -64,14 +211,15 @@ async def register(
     headers = {
         "api-key": shroom_api_key
     }
-    response = requests.post(
-        "https://shroomweb.0xa.pw/register",
-        headers=headers,
-        json=data,
-        timeout=10
-    )
-    if(response.status_code == 200):
-        await interaction.response.send_message(response.content, ephemeral=True)
+    try:
+        async with client.web.post("/register", headers=headers, json=data) as response:
+            status = response.status
+            content = await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        await interaction.response.send_message("Zoinks scoob! That one didn't work.", ephemeral=True)
+        return
+    if(status == 200):
+        await interaction.response.send_message(content, ephemeral=True)
     else:
         await interaction.response.send_message("You already exist!", ephemeral=True)
 
@@ -90,38 +238,35 @@ async def shroom(
 ):
     # Step 1: Defer immediately (so Discord doesn't timeout)
     await interaction.response.defer(thinking=True)
-    if largebiomes:
-        user_shroom_running.append(interaction.user.id)
-    cmd = [
-        "./sizeCheck",
-        "--worldseed", worldseed,
-        "--x", str(x),
-        "--z", str(z),
-        "--largebiomes", str(largebiomes)
-    ]
-
+    key = (worldseed.strip(), x, z, largebiomes)
     try:
-        # Step 2: Run subprocess asynchronously
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            await interaction.followup.send(
-                f"❌ Error running subprocess:\n```{stderr.decode().strip()}```"
-            )
-            return
+        future = size_checks.submit(interaction.user.id, key)
+    except QueueLimit as e:
+        await interaction.followup.send(f"⚠️ {e}")
+        return
 
-        stdout = stdout.decode().strip()
+    # Step 2: Wait for a worker, showing where we are in the queue
+    shown = None
+    while not future.done():
+        position = size_checks.position(key)
+        if position != shown and (position > 0 or shown is not None):
+            status = f"⏳ Queued, position {position}" if position else "⏳ Running sizeCheck..."
+            await interaction.edit_original_response(content=status)
+            shown = position
+        await asyncio.wait({future}, timeout=QUEUE_STATUS_INTERVAL)
 
+    try:
+        returncode, stdout, stderr = future.result()
     except Exception as e:
         await interaction.followup.send(f"❌ Exception: {e}")
         return
 
+    if returncode != 0:
+        await interaction.followup.send(
+            f"❌ Error running subprocess:\n```{stderr}```"
+        )
+        return
+
     # Step 3: Parse output
     if "does not exist" in stdout or "could otherwise not be measured" in stdout:
         await interaction.followup.send("⚠️ Coordinates are wrong.")
@@ -143,8 +288,6 @@ async def shroom(
             "❌ Error: Could not parse area output.\n"
             f"```{stdout}```"
         )
-    if largebiomes:
-        user_shroom_running.remove(interaction.user.id)
 # Don’t forget to sync commands on startup
 @client.event
 async def on_ready():
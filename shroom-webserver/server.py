@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException, Request
-from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from contextlib import asynccontextmanager, contextmanager
 from pydantic import BaseModel
 from typing import List
 from datetime import datetime, timezone
 from Crypto.Hash import SHA256
 from Crypto.PublicKey import ECC
 from Crypto.Signature import DSS
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 import os
+import fcntl
 import secrets, string, base64, json, hashlib
+import asyncio
+import bisect
 import logging
+import math
+import queue
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import select
+import threading
+import time
+import zlib
 
 pwd = os.getenv("SHROOM_KEY_PW")
 SHROOM_SB_TABLE_NAME = os.getenv("SHROOM_SB_TABLE_NAME")
@@ -28,10 +43,13 @@ def generate_key_pair():
                                 passphrase=pwd,
                                 protection='PBKDF2WithHMAC-SHA512AndAES256-CBC',
                                 prot_params={'iteration_count':131072})
-    with open("shroom.priv", "wb") as f:
-        f.write(priv_out.encode('utf-8'))
-    with open("shroom.pub", "wb") as f:
-        f.write(pub_out.encode('utf-8'))
+    # Write then rename so another worker never reads a half-written key.
+    for path, data in (("shroom.pub", pub_out), ("shroom.priv", priv_out)):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
     return mykey
 
 def get_jwt_headers():
@@ -65,18 +83,718 @@ DB_CONFIG = {
     "dbname": os.getenv("SHROOM_DB_NAME"),
     "user": os.getenv("SHROOM_DB_USER"),
     "password": os.getenv("PGPASSWORD"),
-    "host": "postgres", #Leave alone if you're on docker, change if not
-    "port": 5432,
+    "host": os.getenv("SHROOM_DB_HOST", "postgres"), #Leave alone if you're on docker, change if not
+    "port": int(os.getenv("SHROOM_DB_PORT", "5432")),
 }
+WEB_WORKERS = int(os.getenv("SHROOM_WEB_WORKERS", "1"))  # uvicorn worker processes, each with its own pool
+FILTER_CAPACITY = int(os.getenv("SHROOM_FILTER_CAPACITY", "10000000"))  # rows per table the seen-filters are sized for, 0 disables them
+# SHROOM_DB_POOL_MAX is the connection budget for the whole web server; every
+# worker process gets an equal share of it. Each worker also holds connections
+# outside its pool: one for notification_listener and, while the seen-filters
+# load, one per result table. Those come out of its share first.
+DB_BUDGET = int(os.getenv("SHROOM_DB_POOL_MAX", "10"))
+DB_WORKER_EXTRA = 1 + (2 if FILTER_CAPACITY > 0 else 0)
+DB_POOL_MAX = DB_BUDGET // WEB_WORKERS - DB_WORKER_EXTRA
+if DB_POOL_MAX < 2:
+    raise SystemExit(
+        f"SHROOM_DB_POOL_MAX={DB_BUDGET} is too small for {WEB_WORKERS} worker(s): each needs "
+        f"{DB_WORKER_EXTRA} connection(s) of its own plus a pool of at least 2, "
+        f"so set it to {WEB_WORKERS * (DB_WORKER_EXTRA + 2)} or more"
+    )
+DB_POOL_MIN = min(int(os.getenv("SHROOM_DB_POOL_MIN", "1")), DB_POOL_MAX)
+DB_POOL_TIMEOUT = float(os.getenv("SHROOM_DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+INGEST_PAGE_SIZE = 1000  # rows per multi-row VALUES statement when staging an upload
+INGEST_WORKERS = int(os.getenv("SHROOM_INGEST_WORKERS", str(max(1, DB_POOL_MAX // 4))))  # uploads processed at once
+READ_WORKERS = max(1, DB_POOL_MAX - INGEST_WORKERS)  # the rest of the pool stays free for reads
+STREAM_QUEUE_CHUNKS = 8  # parsed chunks buffered between a streaming upload and the database
+STREAM_IDLE_TIMEOUT = float(os.getenv("SHROOM_STREAM_IDLE_TIMEOUT", "60"))  # seconds to wait for more of a streamed body
+STREAM_MIN_RATE = float(os.getenv("SHROOM_STREAM_MIN_RATE", "100"))  # rows/second a streamed upload must average, 0 disables the check
+STREAM_MIN_RATE_GRACE = 10  # seconds a streamed upload may run before its rate is checked
+MAX_INFLATED_BYTES = int(os.getenv("SHROOM_MAX_INFLATED_BYTES", str(512 * 1024 * 1024)))  # largest body a gzip request may inflate to
+PACKED_ROW = struct.Struct("<4q")  # seed, x, z, claimed_size as little-endian int64
+LEADERBOARD_DEPTH = int(os.getenv("SHROOM_LEADERBOARD_DEPTH", "10000"))  # ranked rows kept in memory per biome mode
+LEADERBOARD_REBUILD = float(os.getenv("SHROOM_LEADERBOARD_REBUILD", "300"))  # seconds between full reloads, catches missed notifications
+THRESHOLD_RANK = int(os.getenv("SHROOM_THRESHOLD_RANK", "1000"))  # leaderboard place a submission should be able to beat
+THRESHOLD_RATIO = float(os.getenv("SHROOM_THRESHOLD_RATIO", "0.9"))  # claims are approximate; accept this far below the cutoff
+MIN_CLAIM = int(os.getenv("SHROOM_MIN_CLAIM", "0"))  # claims below this are never worth uploading
+FILTER_FP_RATE = float(os.getenv("SHROOM_FILTER_FP_RATE", "0.01"))  # chance a new seed still needs a database lookup
+FILTER_FETCH_ROWS = 10000  # announced rows read into a seen-filter at a time
+FILTER_RETRY_MIN = 5  # seconds before a failed seen-filter load is retried, doubling each time
+FILTER_RETRY_MAX = 300
+AUTH_CACHE_SIZE = int(os.getenv("SHROOM_AUTH_CACHE_SIZE", "10000"))  # verified API keys remembered
+AUTH_CACHE_TTL = float(os.getenv("SHROOM_AUTH_CACHE_TTL", "300"))  # seconds before a key is verified again
+
+# -------------------------
+# Metrics
+# -------------------------
+# Served at /metrics. With several workers, PROMETHEUS_MULTIPROC_DIR must point
+# at an empty directory shared by them so the endpoint reports every process.
+REQUEST_SECONDS = Histogram(
+    "shroom_request_seconds", "Time to serve a request", ["method", "route", "status"],
+)
+REQUEST_BYTES = Histogram(
+    "shroom_request_bytes", "Request body size as sent, before gzip is inflated", ["route"],
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9),
+)
+AUTH_SECONDS = Histogram(
+    "shroom_auth_seconds", "Time to authenticate an API key", ["source"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+INGEST_ROWS = Counter("shroom_ingest_rows", "Uploaded rows by outcome", ["table", "outcome"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "shroom_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(0.0001, 0.001, 0.01, 0.1, 0.5, 1, 5, 10, 30),
+)
+DB_POOL_IN_USE = Gauge("shroom_db_pool_in_use", "Pooled connections checked out", multiprocess_mode="livesum")
+DB_POOL_SIZE = Gauge("shroom_db_pool_size", "Pooled connections allowed", multiprocess_mode="livesum")
+DB_POOL_TIMEOUTS = Counter("shroom_db_pool_timeouts", "Checkouts that gave up waiting for a connection")
+
+class DBPool:
+    """
+    Wraps psycopg2's ThreadedConnectionPool so that callers wait for a free
+    connection (up to DB_POOL_TIMEOUT) instead of getting a PoolError, and
+    every checkout is returned to the pool no matter how the caller exits.
+    """
+    def __init__(self, minconn: int, maxconn: int, timeout: float, **kwargs):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.maxconn = maxconn
+        self.timeout = timeout
+        DB_POOL_SIZE.set(maxconn)
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_seconds = 0.0
+
+    @contextmanager
+    def connection(self):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            DB_POOL_TIMEOUTS.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Database is busy, try again later",
+            )
+        waited = time.monotonic() - start
+        DB_POOL_WAIT_SECONDS.observe(waited)
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds += waited
+            if waited > 0.001:
+                self.waits += 1
+        DB_POOL_IN_USE.inc()
+        discard = False
+        try:
+            yield conn
+        finally:
+            # Never hand an open transaction back to the pool. Anything the caller
+            # wanted to keep has been committed already, so this is a no-op then.
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+            discard = discard or bool(conn.closed)
+            self._pool.putconn(conn, close=discard)
+            with self._lock:
+                self.in_use -= 1
+                if discard:
+                    self.discarded += 1
+            DB_POOL_IN_USE.dec()
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+class ApiKeyCache:
+    """
+    Maps the SHA-256 of an already verified API key to its user id, so repeat
+    requests skip the signature check and the users lookup. Entries expire
+    after AUTH_CACHE_TTL seconds, the least recently used are evicted past
+    AUTH_CACHE_SIZE, and invalidate_user() drops every key of a user that was
+    removed or changed.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._drop(digest)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest: bytes, user_id: int):
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (user_id, time.monotonic() + self.ttl)
+            self._by_user.setdefault(user_id, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                self._drop(digest)
+
+    def _drop(self, digest: bytes):
+        user_id, _ = self._entries.pop(digest)
+        digests = self._by_user[user_id]
+        digests.discard(digest)
+        if not digests:
+            del self._by_user[user_id]
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+api_key_cache = ApiKeyCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+class BloomFilter:
+    """Plain Bloom filter over byte strings, sized for `capacity` items at `fp_rate`."""
+    def __init__(self, capacity: int, fp_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: bytes):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: bytes):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, item: bytes):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+class SeenFilter:
+    """
+    Bloom filters over the seeds and the exact (seed, x, z, claimed_size)
+    tuples stored in one result table and its archive. Ingest asks them
+    first: a definite miss means the row is new and its database lookups can
+    be skipped; only possible hits go to the database.
+
+    reload() rebuilds both filters from the table in a background thread,
+    retrying until it succeeds, and every committed upload's rows are added
+    as they're announced (see notification_listener). A committed row is
+    missing from the filters until its notification is handled. high_water
+    is an id every committed row at or below which has been added; the
+    listener only advances it once every transaction that could have drawn
+    such an id has finished, so ingest still checks seeds against the rows
+    above it. Until a load has finished every row counts as a possible hit.
+    """
+    def __init__(self, table_name: str, capacity: int, fp_rate: float):
+        self.table_name = table_name
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.ready = False
+        self.skipped = 0
+        self.checked = 0
+        self.high_water = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._new_filters()
+
+    def _new_filters(self):
+        self.seeds = BloomFilter(self.capacity, self.fp_rate)
+        self.tuples = BloomFilter(self.capacity, self.fp_rate)
+
+    def reload(self):
+        with self._lock:
+            self._generation += 1
+            self.ready = False
+            self._new_filters()
+            generation = self._generation
+        threading.Thread(target=self._load, args=(generation,), name=f"filter-load-{self.table_name}", daemon=True).start()
+
+    def _load(self, generation: int):
+        backoff = FILTER_RETRY_MIN
+        while True:
+            start = time.monotonic()
+            try:
+                if self._load_once(generation):
+                    break
+                return
+            except psycopg2.Error as e:
+                logger.error("Loading seen-filter for %s failed, retrying in %.0fs: %s", self.table_name, backoff, e)
+            # Rows the failed attempt added are stored, so they can stay.
+            time.sleep(backoff)
+            backoff = min(backoff * 2, FILTER_RETRY_MAX)
+            if generation != self._generation:
+                return
+        with self._lock:
+            if generation == self._generation:
+                self.ready = True
+        logger.info("Seen-filter for %s loaded in %.1fs", self.table_name, time.monotonic() - start)
+
+    def _load_once(self, generation: int):
+        """Add every stored row; returns False if a newer reload took over."""
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            cur = conn.cursor(name="seen_filter_load")
+            cur.itersize = 100000
+            cur.execute(
+                f"""
+                SELECT seed, x, z, claimed_size FROM {self.table_name}
+                UNION ALL
+                SELECT seed, x, z, claimed_size FROM {self.table_name}_archive
+                """
+            )
+            batch = []
+            for row in cur:
+                batch.append(row)
+                if len(batch) >= cur.itersize:
+                    if not self.add(batch, generation):
+                        return False
+                    batch = []
+            if not self.add(batch, generation):
+                return False
+            cur.close()
+            return True
+        finally:
+            conn.close()
+
+    def add(self, rows, generation: int = None):
+        """Record stored rows; returns False if a newer reload superseded `generation`."""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            for seed, x, z, claimed_size in rows:
+                self.seeds.add(struct.pack("<q", seed))
+                self.tuples.add(struct.pack("<4q", seed, x, z, claimed_size))
+            return True
+
+    def advance(self, last_id: int):
+        """Note that every committed row up to last_id has been added."""
+        with self._lock:
+            self.high_water = max(self.high_water, last_id)
+
+    def classify(self, rows):
+        """
+        Returns (high_water, rows), where rows yields each row followed by
+        (maybe_tuple_stored, maybe_seed_stored). The filters are read as of
+        this call, so a reload while the rows are consumed can't pair a
+        fresh, half-built filter with the old high_water. high_water is None
+        until a load has finished.
+        """
+        with self._lock:
+            ready, seeds, tuples, high_water = self.ready, self.seeds, self.tuples, self.high_water
+        if not ready:
+            return None, (tuple(row) + (True, True) for row in rows)
+
+        def classified():
+            for seed, x, z, claimed_size in rows:
+                maybe_seed = struct.pack("<q", seed) in seeds
+                maybe_tuple = maybe_seed and struct.pack("<4q", seed, x, z, claimed_size) in tuples
+                self.checked += 1
+                if not maybe_seed:
+                    self.skipped += 1
+                yield (seed, x, z, claimed_size, maybe_tuple, maybe_seed)
+        return high_water, classified()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "high_water": self.high_water,
+            "bytes": len(self.seeds.bits) + len(self.tuples.bits),
+            "checked": self.checked,
+            "skipped_lookups": self.skipped,
+        }
+
+def fetch_inserted(conn, table_name: str, first_id: int, last_id: int):
+    """Yield the rows in an id range in batches of at most FILTER_FETCH_ROWS."""
+    cur = conn.cursor(name="fetch_inserted")
+    cur.itersize = FILTER_FETCH_ROWS
+    try:
+        cur.execute(
+            f"SELECT seed, x, z, claimed_size FROM {table_name} WHERE id BETWEEN %s AND %s",
+            (first_id, last_id),
+        )
+        while True:
+            rows = cur.fetchmany(FILTER_FETCH_ROWS)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+def add_announced(seen: SeenFilter, first_id: int, last_id: int):
+    """Add an announced id range to a filter; returns False if it has to be tried again."""
+    try:
+        with db_connection() as conn:
+            for rows in fetch_inserted(conn, seen.table_name, first_id, last_id):
+                seen.add(rows)
+        return True
+    except Exception as e:
+        logger.error("Adding ids %s-%s to seen-filter for %s failed: %s", first_id, last_id, seen.table_name, e)
+        return False
+
+LB_COLUMNS = """
+    SELECT u.discord_id, x, z, seed, claimed_size, calculated_size, mush.id
+    FROM {table_name} mush
+    JOIN users u on u.id = mush.user_id
+"""
+
+def lb_entry(row):
+    return {
+        "discord_id": row[0],
+        "x": row[1],
+        "z": row[2],
+        "seed": row[3],
+        "claimed_size": row[4],
+        "calculated_size": row[5],
+        "result_id": row[6]
+    }
+
+def lb_key(entry):
+    """Sort key matching ORDER BY calculated_size DESC, claimed_size DESC, id."""
+    return (-entry["calculated_size"], -entry["claimed_size"], entry["result_id"])
+
+class Leaderboard:
+    """
+    The top LEADERBOARD_DEPTH checked rows of one result table, ranked in
+    memory. Loaded at startup, then kept current by apply() as the checker
+    reports newly sized rows. `complete` is True while memory holds every
+    checked row, so lookups past the end don't need the database.
+    """
+    def __init__(self, table_name: str, depth: int):
+        self.table_name = table_name
+        self.depth = depth
+        self.complete = False
+        self.version = 0
+        self.loaded_at = 0.0
+        self._keys = []
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, conn):
+        cur = conn.cursor()
+        cur.execute(
+            LB_COLUMNS.format(table_name=self.table_name) + """
+            WHERE calculated_size is not null
+            ORDER BY mush.calculated_size DESC, mush.claimed_size DESC, mush.id
+            LIMIT %s
+            """, (self.depth,)
+        )
+        entries = [lb_entry(row) for row in cur.fetchall()]
+        cur.close()
+        with self._lock:
+            self._entries = {e["result_id"]: e for e in entries}
+            self._keys = [lb_key(e) for e in entries]
+            self.complete = len(entries) < self.depth
+            self.version += 1
+            self.loaded_at = time.monotonic()
+
+    def apply(self, entries):
+        """Insert or re-rank rows whose calculated_size just changed."""
+        with self._lock:
+            for entry in entries:
+                old = self._entries.pop(entry["result_id"], None)
+                if old is not None:
+                    del self._keys[bisect.bisect_left(self._keys, lb_key(old))]
+                key = lb_key(entry)
+                if not self.complete and self._keys and key > self._keys[-1]:
+                    continue  # ranks below what we hold; the database has rows in between
+                bisect.insort(self._keys, key)
+                self._entries[entry["result_id"]] = entry
+            while len(self._keys) > self.depth:
+                dropped = self._keys.pop()
+                del self._entries[dropped[2]]
+                self.complete = False
+            self.version += 1
+
+    def key_of(self, result_id: int):
+        with self._lock:
+            entry = self._entries.get(result_id)
+            return lb_key(entry) if entry else None
+
+    def position_after(self, key):
+        """Index of the first row ranked after key, or None if key is past what's held."""
+        with self._lock:
+            if not self.complete and (not self._keys or key > self._keys[-1]):
+                return None
+            return bisect.bisect_right(self._keys, key)
+
+    def slice(self, start: int, count: int):
+        """Rows start..start+count from memory, and whether memory had enough of them."""
+        with self._lock:
+            keys = self._keys[start:start + count]
+            covered = self.complete or start + count <= len(self._keys)
+            return [self._entries[k[2]] for k in keys], covered
+
+    def size_at(self, place: int):
+        """calculated_size at a 1-based place, or None if the board is shorter than that."""
+        with self._lock:
+            if place < 1 or place > len(self._keys):
+                return None
+            return -self._keys[place - 1][0]
+
+    def stats(self):
+        with self._lock:
+            return {"rows": len(self._keys), "complete": self.complete, "version": self.version}
+
+def fetch_checked(conn, table_name: str, ids):
+    cur = conn.cursor()
+    cur.execute(
+        LB_COLUMNS.format(table_name=table_name) + """
+        WHERE mush.id = ANY(%s) AND calculated_size is not null
+        """, (list(ids),)
+    )
+    entries = [lb_entry(row) for row in cur.fetchall()]
+    cur.close()
+    return entries
+
+def notification_listener(app: FastAPI, stop: threading.Event):
+    """
+    Keeps in-process state in step with the database.
+
+    The checker NOTIFYs <table>_checked with the ids it just sized; those rows
+    are fetched and merged into app.state.leaderboards. Each board is also
+    reloaded from scratch every LEADERBOARD_REBUILD seconds in case a
+    notification was missed or rows were edited by hand. A trigger on users
+    NOTIFYs users_changed, which evicts that user's cached API keys.
+
+    Every upload NOTIFYs <table>_work with the id range it inserted; those
+    rows are added to the table's SeenFilter. Notifications sent while we
+    weren't listening are lost, so the filters are reloaded after every
+    (re)connect. Work that fails on a pooled connection is retried on the
+    next pass instead of dropping the listening connection.
+
+    Ids are drawn in one order and committed in another, so a filter's
+    high_water can't simply follow the announced ranges. Every pass also
+    reads each table's id sequence and the current snapshot on the listening
+    connection, which delivers every notification committed before it. Ingest
+    has its transaction id before it draws any ids (it has created its staging
+    table by then), so once a later pass finds the snapshot's xmin past the
+    earlier pass's xmax, every row up to the sequence value read then is
+    committed or gone, and its notification has been handled.
+    """
+    boards = {f"{name}_checked": board for name, board in app.state.leaderboards.items()}
+    filters = {f"{name}_work": seen for name, seen in app.state.seen_filters.items()}
+    sequences = ", ".join(
+        f"(SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {seen.table_name}_id_seq)"
+        for seen in filters.values()
+    )
+    probe_sql = (
+        "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, "
+        "pg_snapshot_xmax(pg_current_snapshot())::text::bigint"
+        + (", " + sequences if sequences else "")
+    )
+    while not stop.is_set():
+        listen_conn = None
+        try:
+            listen_conn = psycopg2.connect(**DB_CONFIG)
+            listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = listen_conn.cursor()
+            for channel in boards:
+                cur.execute(f'LISTEN "{channel}"')
+            for channel in filters:
+                cur.execute(f'LISTEN "{channel}"')
+            cur.execute("LISTEN users_changed")
+            for seen in filters.values():
+                seen.reload()
+            announced = []  # (filter, first_id, last_id) not added yet
+            changed = {}  # board channel -> ids not merged yet
+            previous = None
+            while not stop.is_set():
+                for board in boards.values():
+                    if time.monotonic() - board.loaded_at > LEADERBOARD_REBUILD:
+                        try:
+                            with db_connection() as conn:
+                                board.load(conn)
+                        except Exception as e:
+                            logger.error("Reloading leaderboard %s failed: %s", board.table_name, e)
+                select.select([listen_conn], [], [], 1)
+                listen_conn.poll()
+                cur.execute(probe_sql)
+                probe = cur.fetchone()
+                for notify in listen_conn.notifies:
+                    if notify.channel == "users_changed":
+                        api_key_cache.invalidate_user(int(notify.payload))
+                    elif notify.channel in filters:
+                        first_id, last_id = (int(i) for i in notify.payload.split(","))
+                        announced.append((filters[notify.channel], first_id, last_id))
+                    else:
+                        ids = changed.setdefault(notify.channel, set())
+                        ids.update(int(i) for i in notify.payload.split(",") if i)
+                listen_conn.notifies.clear()
+                announced = [item for item in announced if not add_announced(*item)]
+                for channel, ids in list(changed.items()):
+                    try:
+                        with db_connection() as conn:
+                            boards[channel].apply(fetch_checked(conn, boards[channel].table_name, ids))
+                        del changed[channel]
+                    except Exception as e:
+                        logger.error("Updating leaderboard %s failed: %s", boards[channel].table_name, e)
+                if previous is not None and probe[0] >= previous[1]:
+                    behind = {item[0] for item in announced}
+                    for seen, last_id in zip(filters.values(), previous[2:]):
+                        if seen not in behind:
+                            seen.advance(last_id)
+                previous = probe
+        except Exception as e:
+            logger.error("Notification listener failed: %s", e)
+            stop.wait(5)
+        finally:
+            if listen_conn is not None:
+                listen_conn.close()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Application starting up (lifespan)...")
     await load_or_generate_key()
+    app.state.db_pool = DBPool(DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, **DB_CONFIG)
+    print(f"Database pool ready ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+    app.state.leaderboards = {
+        SHROOM_SB_TABLE_NAME: Leaderboard(SHROOM_SB_TABLE_NAME, LEADERBOARD_DEPTH),
+        SHROOM_LB_TABLE_NAME: Leaderboard(SHROOM_LB_TABLE_NAME, LEADERBOARD_DEPTH),
+    }
+    app.state.seen_filters = {}
+    if FILTER_CAPACITY > 0:
+        app.state.seen_filters = {
+            SHROOM_SB_TABLE_NAME: SeenFilter(SHROOM_SB_TABLE_NAME, FILTER_CAPACITY, FILTER_FP_RATE),
+            SHROOM_LB_TABLE_NAME: SeenFilter(SHROOM_LB_TABLE_NAME, FILTER_CAPACITY, FILTER_FP_RATE),
+        }
+    app.state.read_executor = ThreadPoolExecutor(READ_WORKERS, thread_name_prefix="db-read")
+    app.state.ingest_executor = ThreadPoolExecutor(INGEST_WORKERS, thread_name_prefix="db-ingest")
+    with db_connection() as conn:
+        for board in app.state.leaderboards.values():
+            board.load(conn)
+    stop_listener = threading.Event()
+    threading.Thread(
+        target=notification_listener, args=(app, stop_listener), name="notification-listener", daemon=True
+    ).start()
     yield
+    stop_listener.set()
     print("Application shuting down (lifespan)...")
+    app.state.read_executor.shutdown()
+    app.state.ingest_executor.shutdown()
+    app.state.db_pool.close()
+
+class GzipRequestMiddleware:
+    """
+    Inflates request bodies sent with Content-Encoding: gzip. Works message by
+    message, so streamed uploads stay streamed. A body that inflates past
+    MAX_INFLATED_BYTES is refused with a 413 before the excess is produced.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (b"content-encoding", b"gzip") not in scope["headers"]:
+            return await self.app(scope, receive, send)
+        inflater = zlib.decompressobj(wbits=31)
+        inflated = 0
+
+        async def inflating_receive():
+            nonlocal inflated
+            message = await receive()
+            if message["type"] == "http.request":
+                try:
+                    # One byte over the limit is enough to know it's too big.
+                    body = inflater.decompress(message.get("body", b""), MAX_INFLATED_BYTES - inflated + 1)
+                    if not message.get("more_body", False) and not inflater.unconsumed_tail:
+                        body += inflater.flush()
+                except zlib.error:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Body is not valid gzip",
+                    )
+                inflated += len(body)
+                if inflated > MAX_INFLATED_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Body inflates to more than {MAX_INFLATED_BYTES} bytes",
+                    )
+                message = dict(message, body=body)
+            return message
+
+        # Edited in place rather than copied so outer middleware still sees
+        # what the router adds to the scope.
+        scope["headers"] = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        await self.app(scope, inflating_receive, send)
+
+class MetricsMiddleware:
+    """
+    Records every request's latency by method, route template and status, and
+    its body size as it arrived on the wire. Requests that match no route are
+    counted under "unmatched" so stray URLs can't grow the label set.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.monotonic()
+        status = 500
+        received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, recording_send)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.monotonic() - start)
+            if received:
+                REQUEST_BYTES.labels(path).observe(received)
 
 # FastAPI App
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(GzipRequestMiddleware)
+app.add_middleware(MetricsMiddleware)
 logger = logging.getLogger("server")
 
 # Pydantic Models
@@ -94,6 +812,9 @@ class ResultEntry(BaseModel):
 class UserEntry(BaseModel):
     discord_id: int
 
+class UsersEntry(BaseModel):
+    discord_ids: List[int]
+
 class SeedEntry(BaseModel):
     seed: int
     x: int
@@ -106,34 +827,69 @@ class Payload(BaseModel):
 
 # Database Helper
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+def db_connection():
+    """Check a connection out of the shared pool; use as a context manager."""
+    return app.state.db_pool.connection()
+
+def with_connection(fn, *args):
+    with db_connection() as conn:
+        return fn(conn, *args)
+
+async def run_db(fn, *args, ingest: bool = False):
+    """
+    Run fn(conn, *args) on a pooled connection in a worker thread so blocking
+    psycopg2 calls never stall the event loop. Uploads get their own small
+    executor (INGEST_WORKERS threads), so however many large batches are in
+    flight the remaining READ_WORKERS connections stay free for reads.
+    """
+    executor = app.state.ingest_executor if ingest else app.state.read_executor
+    return await asyncio.get_running_loop().run_in_executor(executor, with_connection, fn, *args)
+
+def executor_stats(executor: ThreadPoolExecutor):
+    return {"workers": executor._max_workers, "queued": executor._work_queue.qsize()}
 
 async def load_or_generate_key():
     logger.info("Initializing ECC key… (PID %s)", os.getpid())
-    if not os.path.exists("shroom.priv"):
-        key = generate_key_pair()
-    else:
-        key = import_key()
-    pem = key.export_key(
-        format="PEM",
-        passphrase=pwd,
-        protection="PBKDF2WithHMAC-SHA512AndAES256-CBC",
-        prot_params={"iteration_count": 131072},
-    )
+    # With several workers starting at once, only the first to take the lock
+    # generates a key; the others wait and then load that same key.
+    with open("shroom.priv.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists("shroom.priv"):
+                key = generate_key_pair()
+            else:
+                key = import_key()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
     logger.info("ECC key ready with curve: %s", key.curve)
     app.state.key = key
+    app.state.public_key = key.public_key()
 # API Endpoint
 
 async def authenticate(api_key: string):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    encoded_header, encoded_payload, encoded_signature = api_key.split(".")
-    discord_id, created_at = base64.urlsafe_b64decode(encoded_payload).decode("utf-8").removeprefix('"').removesuffix('"').split(".", 1)
+    start = time.monotonic()
+    source = "cache"
+    try:
+        digest = hashlib.sha256(api_key.encode("utf-8")).digest()
+        user_id = api_key_cache.get(digest)
+        if user_id is not None:
+            return user_id
+        source = "database"
+
+        encoded_header, encoded_payload, encoded_signature = api_key.split(".")
+        discord_id, created_at = base64.urlsafe_b64decode(encoded_payload).decode("utf-8").removeprefix('"').removesuffix('"').split(".", 1)
+
+        padding_correction = "=" * ((4 - len(encoded_signature) % 4) % 4)
+        received_signature = base64.urlsafe_b64decode(encoded_signature + padding_correction)
+        received_message = f"{encoded_header}.{encoded_payload}".encode("utf-8")
+        user_id = await run_db(verify_api_key, discord_id, received_message, received_signature)
+        api_key_cache.put(digest, user_id)
+        return user_id
+    finally:
+        AUTH_SECONDS.labels(source).observe(time.monotonic() - start)
 
-    padding_correction = "=" * ((4 - len(encoded_signature) % 4) % 4)
-    received_signature = base64.urlsafe_b64decode(encoded_signature + padding_correction)
-    received_message = f"{encoded_header}.{encoded_payload}".encode("utf-8")
+def verify_api_key(conn, discord_id: str, received_message: bytes, received_signature: bytes):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     cur.execute(
         f"""
         SELECT id FROM users
@@ -141,88 +897,79 @@ async def authenticate(api_key: string):
         """, (discord_id,)
     )
     user_id = cur.fetchone()
-    if user_id:
-        print(app.state.key.public_key().export_key(format="PEM"))
-        hash = SHA256.new(received_message)
-        verifier = DSS.new(app.state.key.public_key(), 'deterministic-rfc6979')
-        try:
-            verifier.verify(hash, received_signature)
-        except:
-            raise HTTPException(
-                status_code=401,
-                detail=f"Invalid API Key provided",
-            )
+    cur.close()
+    if not user_id:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Invalid API Key provided",
+        )
+    hash = SHA256.new(received_message)
+    verifier = DSS.new(app.state.public_key, 'deterministic-rfc6979')
+    try:
+        verifier.verify(hash, received_signature)
+    except ValueError:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Invalid API Key provided",
+        )
     return int(user_id[0])
+
 @app.get("/validate")
 async def validate(payload: ResultEntry, request: Request):
-    conn = get_db_connection()
+    return await run_db(validate_result, payload)
+
+def validate_result(conn, payload: ResultEntry):
     cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     table_name = "small_biomes" if payload.small_biomes else "large_biomes"
+    cur.close()
 
 @app.get("/profile")
 async def profile(payload: UserEntry, request: Request):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    profiles = await run_db(get_profiles, [payload.discord_id])
+    return profiles[0]
 
+@app.post("/profiles")
+async def profiles(payload: UsersEntry, request: Request):
+    if len(payload.discord_ids) > 1000:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most 1000 discord ids per request"
+        )
+    return await run_db(get_profiles, payload.discord_ids)
+
+def get_profiles(conn, discord_ids: List[int]):
+    """Score and count per biome mode for each discord id, from the user_totals rollup."""
+    cur = conn.cursor()
     cur.execute(
-        f"""
-        SELECT sum(calculated_size) FROM small_biomes sm
-        JOIN users u on u.id = sm.user_id
-        WHERE u.id = {payload.discord_id}
-        """
-    )
-    small_biomes_total = cur.fetchone()[0]
-    cur.execute(
-        f"""
-        SELECT sum(calculated_size) FROM large_biomes lb
-        JOIN users u on u.id = lb.user_id
-        WHERE u.id = {payload.discord_id}
-        """
-    )
-    large_biomes_total = cur.fetchone()[0]
-    cur.execute(
-        f"""
-        SELECT count(*) FROM small_biomes sm
-        JOIN users u on u.id = sm.user_id
-        WHERE u.id = {payload.discord_id}
-        AND calculated_size is not null
-        """
-    )
-    small_biomes_count = cur.fetchone()[0]
-    cur.execute(
-        f"""
-        SELECT count(*) FROM small_biomes sm
-        JOIN users u on u.id = sm.user_id
-        WHERE u.id = {payload.discord_id}
-        AND calculated_size is not null
         """
+        SELECT u.discord_id, t.table_name, t.score, t.count
+        FROM users u
+        JOIN user_totals t on t.user_id = u.id
+        WHERE u.discord_id = ANY(%s)
+        """, (list(discord_ids),)
     )
-    large_biomes_count = cur.fetchone()[0]
-    return {
-        "discord_id": payload.discord_id,
-        "sb_score": small_biomes_total,
-        "sb_count": small_biomes_count,
-        "lb_score": large_biomes_total,
-        "lb_count": large_biomes_count
-    }
+    totals = {}
+    for discord_id, table_name, score, count in cur.fetchall():
+        totals[(discord_id, table_name)] = (score, count)
+    cur.close()
+    profiles = []
+    for discord_id in discord_ids:
+        sb_score, sb_count = totals.get((discord_id, SHROOM_SB_TABLE_NAME), (None, 0))
+        lb_score, lb_count = totals.get((discord_id, SHROOM_LB_TABLE_NAME), (None, 0))
+        profiles.append({
+            "discord_id": discord_id,
+            "sb_score": sb_score,
+            "sb_count": sb_count,
+            "lb_score": lb_score,
+            "lb_count": lb_count
+        })
+    return profiles
 
 @app.get("/result")
 async def get_result(request: Request, id: int, lb: bool = False):
     table_name = f"{SHROOM_LB_TABLE_NAME}" if lb else f"{SHROOM_SB_TABLE_NAME}"
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-
-    cur.execute(
-        f"""
-        SELECT seed, x, z, claimed_size, calculated_size, manual_check_needed, res.created_at, u.discord_id
-        FROM {table_name} res
-        join users u on u.id = res.user_id
-        WHERE res.id = {id}
-        """
-    )
-    results = cur.fetchone()
-    if len(results) > 0:
+    results = await run_db(fetch_result, table_name, id)
+    if results:
         return {
             "seed":                 results[0],
             "x":                    results[1],
@@ -239,11 +986,27 @@ async def get_result(request: Request, id: int, lb: bool = False):
             detail=f"Result not found with id {id}"
         )
 
+def fetch_result(conn, table_name: str, id: int):
+    # Rows the checker's compactor moved to cold storage are only looked up
+    # once the hot table comes up empty.
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    for source in (table_name, f"{table_name}_archive"):
+        cur.execute(
+            f"""
+            SELECT seed, x, z, claimed_size, calculated_size, manual_check_needed, res.created_at, u.discord_id
+            FROM {source} res
+            join users u on u.id = res.user_id
+            WHERE res.id = %s
+            """, (id,)
+        )
+        results = cur.fetchone()
+        if results:
+            break
+    cur.close()
+    return results
+
 @app.get("/user")
 async def get_user(request: Request, id: int = 0, discord_id: int = 0):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
     if ((id != 0 and discord_id != 0 )or (id == 0 and discord_id == 0)):
         raise HTTPException(
             status_code=400,
@@ -251,16 +1014,8 @@ async def get_user(request: Request, id: int = 0, discord_id: int = 0):
         )
     where_clause = f"id = {id}" if discord_id == 0 else f"discord_id = {discord_id}"
 
-    cur.execute(
-        f"""
-        SELECT id, discord_id, created_at
-        FROM users
-        WHERE {where_clause}
-        LIMIT 1
-        """
-    )
-    results = cur.fetchone()
-    if len(results) > 0:
+    results = await run_db(fetch_user, where_clause)
+    if results:
         return {
             "id": results[0],
             "discord_id": results[1],
@@ -272,104 +1027,230 @@ async def get_user(request: Request, id: int = 0, discord_id: int = 0):
             detail=f"Could not find user where {where_clause}"
         )
 
+def fetch_user(conn, where_clause: str):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute(
+        f"""
+        SELECT id, discord_id, created_at
+        FROM users
+        WHERE {where_clause}
+        LIMIT 1
+        """
+    )
+    results = cur.fetchone()
+    cur.close()
+    return results
+
+@app.get("/stats")
+async def stats(request: Request):
+    return {
+        "pid": os.getpid(),
+        "db_pool": app.state.db_pool.stats(),
+        "leaderboards": {name: board.stats() for name, board in app.state.leaderboards.items()},
+        "api_key_cache": api_key_cache.stats(),
+        "seen_filters": {name: seen.stats() for name, seen in app.state.seen_filters.items()},
+        "executors": {
+            "read": executor_stats(app.state.read_executor),
+            "ingest": executor_stats(app.state.ingest_executor),
+        },
+    }
+
+@app.get("/metrics")
+async def metrics():
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/thresholds")
+async def thresholds(response: Response):
+    """
+    What a submission needs to be worth uploading, per biome mode, so clients
+    can drop hopeless rows before sending them. cutoff_size is the
+    calculated_size at place cutoff_rank (null while the leaderboard is
+    shorter); min_claim is the smallest claimed_size worth sending.
+    """
+    response.headers["Cache-Control"] = "public, max-age=60"
+    message = {}
+    for mode, table_name in (("sb", SHROOM_SB_TABLE_NAME), ("lb", SHROOM_LB_TABLE_NAME)):
+        cutoff = app.state.leaderboards[table_name].size_at(THRESHOLD_RANK)
+        message[mode] = {
+            "cutoff_rank": THRESHOLD_RANK,
+            "cutoff_size": cutoff,
+            "min_claim": max(MIN_CLAIM, int(cutoff * THRESHOLD_RATIO)) if cutoff is not None else MIN_CLAIM,
+        }
+    return message
+
 @app.get("/sb_leaderboard")
-async def small_biomes_lb(request: Request, count: int = 50, page: int = 1):
-    return await get_lb(count, page, True)
+async def small_biomes_lb(request: Request, count: int = 50, page: int = 1, after: str = None):
+    return await get_lb(count, page, True, after)
 
 @app.get("/lb_leaderboard")
-async def large_biomes_lb(request: Request, count: int = 50, page: int = 1):
-    return await get_lb(count, page, False)
+async def large_biomes_lb(request: Request, count: int = 50, page: int = 1, after: str = None):
+    return await get_lb(count, page, False, after)
 
-async def get_lb(count: int, page: int = 1, small_biomes: bool = True):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    table_name = "small_biomes" if small_biomes else "large_biomes"
+async def get_lb(count: int, page: int = 1, small_biomes: bool = True, after: str = None):
+    """
+    Ranked checked results, {place: entry}, served from the in-memory
+    Leaderboard. `after=<calculated_size>,<result_id>,<place>` continues
+    after a given row (keyset pagination) and takes precedence over `page`.
+    The response includes "next", the cursor for the following page, when
+    there is one. The place only matters past the in-memory board, where it
+    numbers the rows without counting everything ranked above them.
+    """
+    table_name = SHROOM_SB_TABLE_NAME if small_biomes else SHROOM_LB_TABLE_NAME
+    board = app.state.leaderboards[table_name]
     limit = count
     if limit > 1000 :
         limit = 1000
+    if limit < 1 :
+        return {}
 
     if page < 1 :
         page = 1
 
-    cur.execute(
-        f"""
-            SELECT u.discord_id, x, z, seed, claimed_size, calculated_size, mush.id from {table_name} mush
-            JOIN users u on u.id = mush.user_id
-            WHERE calculated_size is not null
-            GROUP BY u.discord_id, seed, claimed_size, calculated_size, mush.id
-            ORDER BY mush.calculated_size DESC, mush.claimed_size DESC
-            LIMIT {limit}
-            OFFSET {(page-1)*limit}
-        """)
+    after_key = None
+    after_place = None
+    if after is not None:
+        try:
+            fields = [int(v) for v in after.split(",")]
+            if len(fields) == 3:
+                after_size, after_id, after_place = fields
+            else:
+                after_size, after_id = fields
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"after must be <calculated_size>,<result_id>,<place>"
+            )
+        after_key = board.key_of(after_id)
+        if after_key is None:
+            row = await run_db(fetch_claimed_size, table_name, after_id)
+            if not row:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Result not found with id {after_id}"
+                )
+            after_key = (-after_size, -row[0], after_id)
+        start = board.position_after(after_key)
+        if start is None and after_place is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"after needs the place past the top {board.depth} rows, use the next cursor as given"
+            )
+    else:
+        start = (page-1)*limit
+
+    entries, covered = board.slice(start, limit) if start is not None else ([], False)
+    if not covered:
+        # Deeper than the in-memory board holds; continue in the database from
+        # the last row we have.
+        entries += await run_db(fetch_lb_page, table_name, limit - len(entries), entries[-1] if entries else None, after_key, start)
+        if start is None:
+            start = after_place
+
     message = {}
-    results = cur.fetchall()
-    place = 1+((page-1)*limit)
-    for result in results:
-        message[place] = {
-            "discord_id": result[0],
-            "x": result[1],
-            "z": result[2],
-            "seed": result[3],
-            "claimed_size": result[4],
-            "calculated_size": result[5],
-            "result_id": result[6]
-        }
+    place = 1+start
+    for entry in entries:
+        message[place] = entry
         place += 1
+    if len(entries) == limit:
+        message["next"] = f"{entries[-1]['calculated_size']},{entries[-1]['result_id']},{place - 1}"
     return message
 
+def fetch_claimed_size(conn, table_name: str, id: int):
+    cur = conn.cursor()
+    cur.execute(f"SELECT claimed_size FROM {table_name} WHERE id = %s", (id,))
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+def ranked_after(key):
+    """WHERE clause (and params) for rows ranked after key in leaderboard order."""
+    size, claimed, result_id = -key[0], -key[1], key[2]
+    return (
+        "(calculated_size < %s OR (calculated_size = %s AND (claimed_size < %s OR (claimed_size = %s AND mush.id > %s))))",
+        (size, size, claimed, claimed, result_id),
+    )
+
+def fetch_lb_page(conn, table_name: str, limit: int, last_entry, after_key, start):
+    cur = conn.cursor()
+    if last_entry is not None or after_key is not None:
+        where, params = ranked_after(lb_key(last_entry) if last_entry is not None else after_key)
+        cur.execute(
+            LB_COLUMNS.format(table_name=table_name) + f"""
+            WHERE calculated_size is not null AND {where}
+            ORDER BY mush.calculated_size DESC, mush.claimed_size DESC, mush.id
+            LIMIT %s
+            """, params + (limit,)
+        )
+    else:
+        cur.execute(
+            LB_COLUMNS.format(table_name=table_name) + """
+            WHERE calculated_size is not null
+            ORDER BY mush.calculated_size DESC, mush.claimed_size DESC, mush.id
+            LIMIT %s
+            OFFSET %s
+            """, (limit, start)
+        )
+    entries = [lb_entry(row) for row in cur.fetchall()]
+    cur.close()
+    return entries
+
 @app.post("/register")
 async def receive_register(payload: UserEntry, request: Request):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
     if "api-key" not in request.headers:    
         raise HTTPException(
             status_code=400,
             detail=f"API Key not provided",
         )
     if await authenticate(request.headers['api-key']) == 13:
-        cur.execute(
-            f"""
-            SELECT id FROM users
-            WHERE discord_id = %s
-            """, (payload.discord_id,)
-        )
-        user_id = cur.fetchone()
-        if not user_id:
-            try:
-                print(app.state.key.public_key().export_key(format="PEM"))
-                encoded_header = encode_headers(get_jwt_headers())
-                created_at = datetime.now(tz=timezone.utc)
-                payload_rebuilt = f"{payload.discord_id}.{created_at.timestamp()}"
-                encoded_payload = encode_payload(payload_rebuilt)
-                full_token = assemble_jwt(encoded_header, encoded_payload, app.state.key)
-
-                print(f"Inserting id {payload.discord_id} and created_at {created_at}")
-                cur.execute(
-                    f"""
-                    INSERT INTO users (discord_id, created_at) values
-                    (%s, %s)
-                    """, (payload.discord_id, created_at)
-                )
-                conn.commit()
-                return full_token
-            except Exception as e:
-                print(f"Encountered an error: {e}")
-
-            finally:
-                cur.close()
-                conn.close()
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"User already exists",
-            )
+        return await run_db(register_user, payload.discord_id)
     else:
         raise HTTPException(
                 status_code=401,
                 detail=f"Unauthorized",
             )
 
+def register_user(conn, discord_id: int):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cur.execute(
+        f"""
+        SELECT id FROM users
+        WHERE discord_id = %s
+        """, (discord_id,)
+    )
+    user_id = cur.fetchone()
+    if not user_id:
+        try:
+            encoded_header = encode_headers(get_jwt_headers())
+            created_at = datetime.now(tz=timezone.utc)
+            payload_rebuilt = f"{discord_id}.{created_at.timestamp()}"
+            encoded_payload = encode_payload(payload_rebuilt)
+            full_token = assemble_jwt(encoded_header, encoded_payload, app.state.key)
+
+            print(f"Inserting id {discord_id} and created_at {created_at}")
+            cur.execute(
+                f"""
+                INSERT INTO users (discord_id, created_at) values
+                (%s, %s)
+                """, (discord_id, created_at)
+            )
+            conn.commit()
+            return full_token
+        except Exception as e:
+            print(f"Encountered an error: {e}")
+
+        finally:
+            cur.close()
+    else:
+        cur.close()
+        raise HTTPException(
+            status_code=400,
+            detail=f"User already exists",
+        )
+
 @app.post("/small_biomes")
 async def small_biomes(payload: Payload, request: Request):
     return await receive_payload(payload, request, True)
@@ -378,13 +1259,19 @@ async def small_biomes(payload: Payload, request: Request):
 async def large_biomes(payload: Payload, request: Request):
     return await receive_payload(payload, request, False)
 
+@app.post("/small_biomes/stream")
+async def small_biomes_stream(request: Request):
+    return await receive_stream(request, True)
+
+@app.post("/large_biomes/stream")
+async def large_biomes_stream(request: Request):
+    return await receive_stream(request, False)
+
 async def receive_payload(payload: Payload, request: Request, small_biomes: bool):
     if(small_biomes):
         TABLE_NAME = os.getenv("SHROOM_SB_TABLE_NAME")
     else:
         TABLE_NAME = os.getenv("SHROOM_LB_TABLE_NAME")
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
     if "api-key" not in request.headers:
         raise HTTPException(
             status_code=400,
@@ -392,58 +1279,239 @@ async def receive_payload(payload: Payload, request: Request, small_biomes: bool
         )
     api_key = request.headers['api-key']
     user_id = await authenticate(api_key)
-    try:
-        for entry in payload.data:
-            # 1. Check for exact match
-            cur.execute(
-                f"""
-                SELECT * FROM {TABLE_NAME}
-                WHERE seed = %s AND x = %s AND z = %s AND claimed_size = %s
-                """,
-                (entry.seed, entry.x, entry.z, entry.claimed_size),
-            )
-            exact_match = cur.fetchone()
+    rows = ((entry.seed, entry.x, entry.z, entry.claimed_size) for entry in payload.data)
+    counts = await run_db(ingest_rows, TABLE_NAME, user_id, rows, ingest=True)
+    return {"status": "success", "message": "Data processed successfully", **counts}
 
-            if exact_match:
-                # Exact match found -> reject
-                continue
+async def receive_stream(request: Request, small_biomes: bool):
+    """
+    Streaming upload. The body is either NDJSON (Content-Type
+    application/x-ndjson, one {"seed", "x", "z", "claimed_size"} object per
+    line) or packed rows (application/octet-stream, four little-endian int64
+    per row: seed, x, z, claimed_size). It is parsed chunk by chunk as it
+    arrives and fed straight into ingest_rows, so memory use doesn't grow
+    with the size of the upload.
 
-            # 2. Check for seed-only match
-            cur.execute(
-                f"""
-                SELECT * FROM {TABLE_NAME}
-                WHERE seed = %s
-                """,
-                (entry.seed,),
-            )
-            seed_match = cur.fetchone()
-
-            if seed_match:
-                # Insert new row with flag = 1
-                cur.execute(
-                    f"""
-                    INSERT INTO {TABLE_NAME} (seed, x, z, claimed_size, duplicate_seed_flag, user_id)
-                    VALUES (%s, %s, %s, %s, 0, %s)
-                    RETURNING id
-                    """,
-                    (entry.seed, entry.x, entry.z, entry.claimed_size, user_id),
+    The upload holds an ingest slot and an open transaction until the body
+    ends, so it is aborted with a 408 if it stalls for STREAM_IDLE_TIMEOUT or
+    averages fewer than STREAM_MIN_RATE rows a second.
+    """
+    TABLE_NAME = SHROOM_SB_TABLE_NAME if small_biomes else SHROOM_LB_TABLE_NAME
+    if "api-key" not in request.headers:
+        raise HTTPException(
+            status_code=400,
+            detail=f"API Key not provided",
+        )
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "application/octet-stream":
+        parse = packed_chunks
+    elif content_type == "application/x-ndjson":
+        parse = ndjson_chunks
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type must be application/x-ndjson or application/octet-stream",
+        )
+    user_id = await authenticate(request.headers['api-key'])
+
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+
+    def rows():
+        while True:
+            try:
+                chunk = chunks.get(timeout=STREAM_IDLE_TIMEOUT)
+            except queue.Empty:
+                raise HTTPException(status_code=408, detail=f"Upload stalled")
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield from chunk
+
+    async def feed(item):
+        # Back off while the database side catches up; stop if it has failed.
+        while not ingest.done():
+            try:
+                chunks.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+    ingest = asyncio.ensure_future(run_db(ingest_rows, TABLE_NAME, user_id, rows(), ingest=True))
+    start = time.monotonic()
+    held_back = 0.0  # time spent waiting on the database, not the client
+    received = 0
+    try:
+        async for chunk in parse(request):
+            fed = time.monotonic()
+            await feed(chunk)
+            held_back += time.monotonic() - fed
+            if ingest.done():
+                # Failed or timed out; no point reading the rest.
+                break
+            received += len(chunk)
+            elapsed = time.monotonic() - start - held_back
+            if STREAM_MIN_RATE > 0 and elapsed > STREAM_MIN_RATE_GRACE and received < STREAM_MIN_RATE * elapsed:
+                raise HTTPException(
+                    status_code=408,
+                    detail=f"Upload too slow, send at least {STREAM_MIN_RATE:g} rows a second",
                 )
-                conn.commit()
-                continue
+        await feed(None)
+    except Exception as e:
+        # Bad row or client went away: abort the transaction, then report.
+        await feed(e)
+        await asyncio.gather(ingest, return_exceptions=True)
+        raise
+    counts = await ingest
+    return {"status": "success", "message": "Data processed successfully", **counts}
 
-            # 3. No match at all → insert normally with flag = 0
-            cur.execute(
-                f"""
-                INSERT INTO {TABLE_NAME} (seed, x, z, claimed_size, duplicate_seed_flag, user_id)
-                VALUES (%s, %s, %s, %s, 0, %s)
-                RETURNING id
-                """,
-                (entry.seed, entry.x, entry.z, entry.claimed_size, user_id),
-            )
-            conn.commit()
+async def packed_chunks(request: Request):
+    """Yield lists of row tuples from a packed binary body as it streams in."""
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        usable = len(buffer) - len(buffer) % PACKED_ROW.size
+        if usable:
+            yield list(PACKED_ROW.iter_unpack(buffer[:usable]))
+            buffer = buffer[usable:]
+    if buffer:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Body is not a whole number of {PACKED_ROW.size}-byte rows",
+        )
 
-        return {"status": "success", "message": "Data processed successfully"}
+async def ndjson_chunks(request: Request):
+    """Yield lists of row tuples from an NDJSON body as it streams in."""
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        rows = [parse_ndjson_row(line) for line in lines if line.strip()]
+        if rows:
+            yield rows
+    if buffer.strip():
+        yield [parse_ndjson_row(buffer)]
 
+def parse_ndjson_row(line: bytes):
+    try:
+        entry = json.loads(line)
+        return (int(entry["seed"]), int(entry["x"]), int(entry["z"]), int(entry["claimed_size"]))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid NDJSON row: {line[:200]!r}",
+        )
+
+def ingest_rows(conn, table_name: str, user_id: int, rows):
+    """
+    Load (seed, x, z, claimed_size) rows into table_name in one transaction.
+
+    Rows go into a temp staging table with a single multi-row INSERT, then one
+    set-based INSERT ... SELECT drops exact matches (against the table and
+    within the batch) and flags rows whose seed is already known. Rows the
+    table's SeenFilter rules out skip those lookups. Returns the number of
+    inserted, seed-duplicate and rejected rows.
+    """
+    seen = app.state.seen_filters.get(table_name)
+    high_water = None
+    if seen is not None:
+        high_water, rows = seen.classify(rows)
+    else:
+        rows = (tuple(row) + (True, True) for row in rows)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TEMP TABLE ingest_staging (
+              ord INT NOT NULL,
+              seed BIGINT NOT NULL,
+              x INT NOT NULL,
+              z INT NOT NULL,
+              claimed_size INT NOT NULL,
+              maybe_tuple BOOLEAN NOT NULL,
+              maybe_seed BOOLEAN NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO ingest_staging (ord, seed, x, z, claimed_size, maybe_tuple, maybe_seed) VALUES %s",
+            ((i,) + tuple(row) for i, row in enumerate(rows)),
+            page_size=INGEST_PAGE_SIZE,
+        )
+        cur.execute("SELECT count(*) FROM ingest_staging")
+        received = cur.fetchone()[0]
+        # Keep the first copy of every tuple that isn't stored yet, in the
+        # table or its archive. Later rows for a seed that is already stored,
+        # or that appeared earlier in this batch, are inserted with
+        # duplicate_seed_flag = 1. The CASEs make sure the lookups only run
+        # for rows the filter couldn't rule out.
+        #
+        # Seeds the filter ruled out are still looked up among rows above its
+        # high_water: uploads commit in any order, and this process may not
+        # have handled their notifications yet. Exact duplicates among them
+        # are caught by the unique index instead.
+        cur.execute(
+            f"""
+            WITH recent AS MATERIALIZED (
+              SELECT seed FROM {table_name} WHERE id > %s
+            ), fresh AS (
+              SELECT DISTINCT ON (seed, x, z, claimed_size) ord, seed, x, z, claimed_size, maybe_seed
+              FROM ingest_staging s
+              WHERE CASE WHEN s.maybe_tuple THEN NOT EXISTS (
+                SELECT 1 FROM {table_name} t
+                WHERE t.seed = s.seed AND t.x = s.x AND t.z = s.z AND t.claimed_size = s.claimed_size
+              ) AND NOT EXISTS (
+                SELECT 1 FROM {table_name}_archive t
+                WHERE t.seed = s.seed AND t.x = s.x AND t.z = s.z AND t.claimed_size = s.claimed_size
+              ) ELSE true END
+              ORDER BY seed, x, z, claimed_size, ord
+            ), ranked AS (
+              SELECT f.*,
+                row_number() OVER (PARTITION BY f.seed ORDER BY f.ord) AS seed_rank,
+                CASE WHEN f.maybe_seed THEN EXISTS (
+                  SELECT 1 FROM {table_name} t WHERE t.seed = f.seed
+                ) OR EXISTS (
+                  SELECT 1 FROM {table_name}_archive t WHERE t.seed = f.seed
+                ) ELSE f.seed IN (SELECT seed FROM recent) END AS seed_known
+              FROM fresh f
+            ), inserted AS (
+              INSERT INTO {table_name} (seed, x, z, claimed_size, duplicate_seed_flag, user_id)
+              SELECT seed, x, z, claimed_size,
+                CASE WHEN seed_known OR seed_rank > 1 THEN 1 ELSE 0 END,
+                %s
+              FROM ranked
+              ORDER BY ord
+              ON CONFLICT DO NOTHING
+              RETURNING id, duplicate_seed_flag
+            )
+            SELECT count(*), count(*) FILTER (WHERE duplicate_seed_flag = 1), min(id), max(id)
+            FROM inserted
+            """,
+            (high_water, user_id),
+        )
+        inserted, duplicate, first_id, last_id = cur.fetchone()
+        if inserted:
+            # Wake the checker for this table and tell every web worker,
+            # this one included, which ids to add to its SeenFilter;
+            # delivered on commit.
+            cur.execute("SELECT pg_notify(%s, %s)", (f"{table_name}_work", f"{first_id},{last_id}"))
+        conn.commit()
+        INGEST_ROWS.labels(table_name, "received").inc(received)
+        INGEST_ROWS.labels(table_name, "inserted").inc(inserted)
+        INGEST_ROWS.labels(table_name, "exact_duplicate").inc(received - inserted)
+        INGEST_ROWS.labels(table_name, "seed_duplicate").inc(duplicate)
+    except psycopg2.DataError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid row values: {e.pgerror or e}",
+        )
     finally:
         cur.close()
-        conn.close()
+    return {
+        "received": received,
+        "inserted": inserted,
+        "duplicate": duplicate,
+        "rejected": received - inserted,
+    }
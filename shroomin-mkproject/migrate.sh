@@ -0,0 +1,33 @@
+# Applies every migrations/NNNN_*.sql file that isn't recorded in
+# schema_migrations yet, in filename order. Each file runs in autocommit mode so
+# it may use CREATE INDEX CONCURRENTLY; files that need a transaction open one
+# themselves. Safe to re-run: applied versions are skipped.
+set -e
+
+PSQL="psql -v ON_ERROR_STOP=1 -d ${SHROOM_DB_NAME}"
+
+$PSQL -qc "CREATE TABLE IF NOT EXISTS schema_migrations (
+  version TEXT PRIMARY KEY,
+  applied_at timestamptz NOT NULL default now()
+);"
+
+for file in migrations/*.sql; do
+    version=$(basename "$file" .sql)
+    applied=$($PSQL -tAc "SELECT 1 FROM schema_migrations WHERE version = '$version'")
+    if [ "$applied" = "1" ]; then
+        continue
+    fi
+    echo "Applying migration $version"
+    # An interrupted CONCURRENTLY build leaves an INVALID index behind that
+    # IF NOT EXISTS would skip; drop those before retrying. Partitioned
+    # parents stay invalid until every partition's index is attached and
+    # can't be dropped concurrently, so they're left for the migration.
+    $PSQL -tAc "SELECT format('DROP INDEX CONCURRENTLY IF EXISTS %I.%I;', n.nspname, c.relname)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE NOT i.indisvalid AND c.relkind = 'i'" | $PSQL -q
+    $PSQL -f "$file"
+    $PSQL -qc "INSERT INTO schema_migrations (version) VALUES ('$version');"
+done
+echo "Schema is up to date"
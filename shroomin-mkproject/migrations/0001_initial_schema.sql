@@ -1,10 +1,10 @@
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
   id SERIAL PRIMARY KEY,
   discord_id BIGINT NOT NULL,
   created_at timestamptz NOT NULL
 );
 
-CREATE TABLE small_biomes (
+CREATE TABLE IF NOT EXISTS small_biomes (
   id SERIAL PRIMARY KEY,
   seed BIGINT NOT NULL,
   x INT NOT NULL,
@@ -21,7 +21,7 @@ CREATE TABLE small_biomes (
   max_z INT default NULL
 );
 
-CREATE TABLE large_biomes (
+CREATE TABLE IF NOT EXISTS large_biomes (
   id SERIAL PRIMARY KEY,
   seed BIGINT NOT NULL,
   x INT NOT NULL,
@@ -36,4 +36,4 @@ CREATE TABLE large_biomes (
   min_z INT default NULL,
   max_x INT default NULL,
   max_z INT default NULL
-)
\ No newline at end of file
+);
@@ -0,0 +1,54 @@
+-- Indexes for the queries the web server and checker run on every request.
+-- Built CONCURRENTLY so a live database keeps taking writes; this file must not
+-- be wrapped in a transaction.
+
+-- Exact-match dedup used by ingest. seed is the leading column, so this also
+-- serves the seed-only duplicate lookup. Racing uploads could have stored the
+-- same tuple twice before this index existed; keep the oldest copy.
+DELETE FROM small_biomes a USING small_biomes b
+WHERE a.seed = b.seed AND a.x = b.x AND a.z = b.z AND a.claimed_size = b.claimed_size
+  AND a.id > b.id;
+DELETE FROM large_biomes a USING large_biomes b
+WHERE a.seed = b.seed AND a.x = b.x AND a.z = b.z AND a.claimed_size = b.claimed_size
+  AND a.id > b.id;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_tuple_key
+  ON small_biomes (seed, x, z, claimed_size);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_tuple_key
+  ON large_biomes (seed, x, z, claimed_size);
+
+-- Checker backlog: unchecked rows, largest claims first.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_unchecked_idx
+  ON small_biomes (claimed_size DESC)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_unchecked_idx
+  ON large_biomes (claimed_size DESC)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
+
+-- Leaderboards: ORDER BY calculated_size DESC, claimed_size DESC over checked rows.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_leaderboard_idx
+  ON small_biomes (calculated_size DESC, claimed_size DESC, id)
+  WHERE calculated_size IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_leaderboard_idx
+  ON large_biomes (calculated_size DESC, claimed_size DESC, id)
+  WHERE calculated_size IS NOT NULL;
+
+-- authenticate() and /register look users up by discord_id. /register used to
+-- check and insert without a lock, so a discord_id may have been registered
+-- twice; keep its oldest user and move the others' results over to it. API
+-- keys only name the discord_id, so every key that worked still does.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM users GROUP BY discord_id HAVING count(*) > 1) THEN
+    CREATE TEMP TABLE duplicate_users ON COMMIT DROP AS
+      SELECT u.id, k.keep
+      FROM users u
+      JOIN (SELECT discord_id, min(id) AS keep FROM users GROUP BY discord_id HAVING count(*) > 1) k
+        ON k.discord_id = u.discord_id AND u.id <> k.keep;
+    UPDATE small_biomes t SET user_id = d.keep FROM duplicate_users d WHERE t.user_id = d.id;
+    UPDATE large_biomes t SET user_id = d.keep FROM duplicate_users d WHERE t.user_id = d.id;
+    DELETE FROM users u USING duplicate_users d WHERE u.id = d.id;
+  END IF;
+END
+$$;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_discord_id_key
+  ON users (discord_id);
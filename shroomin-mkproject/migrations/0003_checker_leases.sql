@@ -0,0 +1,8 @@
+-- Lease columns for the checker work queue. A checker claims rows by setting
+-- leased_until in the future; rows whose lease has expired are claimable again.
+ALTER TABLE small_biomes
+  ADD COLUMN IF NOT EXISTS leased_until timestamptz default NULL,
+  ADD COLUMN IF NOT EXISTS leased_by TEXT default NULL;
+ALTER TABLE large_biomes
+  ADD COLUMN IF NOT EXISTS leased_until timestamptz default NULL,
+  ADD COLUMN IF NOT EXISTS leased_by TEXT default NULL;
@@ -0,0 +1,11 @@
+-- Lets the checker answer a submission from an island that was already
+-- measured: lookups by seed with the bounding box and size read from the index.
+ALTER TABLE small_biomes ADD COLUMN IF NOT EXISTS measured_from_cache BOOLEAN default NULL;
+ALTER TABLE large_biomes ADD COLUMN IF NOT EXISTS measured_from_cache BOOLEAN default NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_island_idx
+  ON small_biomes (seed) INCLUDE (min_x, max_x, min_z, max_z, calculated_size)
+  WHERE calculated_size IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_island_idx
+  ON large_biomes (seed) INCLUDE (min_x, max_x, min_z, max_z, calculated_size)
+  WHERE calculated_size IS NOT NULL;
@@ -0,0 +1,14 @@
+-- Per-user backlog access for the checker's fair-share scheduler: each
+-- submitter's biggest claims and oldest rows without scanning the whole queue.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_user_backlog_size_idx
+  ON small_biomes (user_id, claimed_size DESC)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_user_backlog_size_idx
+  ON large_biomes (user_id, claimed_size DESC)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_user_backlog_age_idx
+  ON small_biomes (user_id, id)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_user_backlog_age_idx
+  ON large_biomes (user_id, id)
+  WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL);
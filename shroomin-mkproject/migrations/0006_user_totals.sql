@@ -0,0 +1,25 @@
+-- Per-user score and count of checked results for each result table, kept up
+-- to date by the checker as it sets calculated_size. Serves /profile.
+CREATE TABLE IF NOT EXISTS user_totals (
+  user_id INT NOT NULL,
+  table_name TEXT NOT NULL,
+  score BIGINT NOT NULL default 0,
+  count INT NOT NULL default 0,
+  PRIMARY KEY (user_id, table_name)
+);
+
+-- Backfill from the existing results. The exclusive lock makes running
+-- checkers wait, so rows they size meanwhile are added on top of this
+-- snapshot rather than counted twice or missed.
+BEGIN;
+LOCK TABLE user_totals IN EXCLUSIVE MODE;
+DELETE FROM user_totals;
+INSERT INTO user_totals (user_id, table_name, score, count)
+SELECT user_id, 'small_biomes', sum(calculated_size), count(*)
+FROM small_biomes WHERE calculated_size IS NOT NULL
+GROUP BY user_id;
+INSERT INTO user_totals (user_id, table_name, score, count)
+SELECT user_id, 'large_biomes', sum(calculated_size), count(*)
+FROM large_biomes WHERE calculated_size IS NOT NULL
+GROUP BY user_id;
+COMMIT;
@@ -0,0 +1,13 @@
+-- Tell the web server when a user row is removed or changed (for example
+-- re-keyed) so it drops any cached API key verification for that user.
+CREATE OR REPLACE FUNCTION notify_users_changed() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('users_changed', OLD.id::text);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_changed ON users;
+CREATE TRIGGER users_changed
+  AFTER UPDATE OR DELETE ON users
+  FOR EACH ROW EXECUTE FUNCTION notify_users_changed();
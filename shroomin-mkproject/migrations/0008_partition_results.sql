@@ -0,0 +1,141 @@
+-- Turns small_biomes and large_biomes into tables hash-partitioned by seed,
+-- so dedup and island lookups (which always filter on seed) touch a single
+-- partition and vacuum/index work is split into smaller pieces.
+--
+-- The move is online: a trigger mirrors every write on the old table into
+-- the new one while existing rows are copied over in committed batches. Only
+-- the final rename takes a short exclusive lock, and it stops waiting for it
+-- after lock_timeout so queries aren't held up. The old table is kept as
+-- <table>_unpartitioned; drop it once you're happy with the result.
+--
+-- Must run outside a transaction block (the procedure commits as it goes).
+
+CREATE OR REPLACE PROCEDURE partition_result_table(tbl text, partitions int, batch int)
+LANGUAGE plpgsql AS $$
+DECLARE
+  part text := tbl || '_partitioned';
+  old text := tbl || '_unpartitioned';
+  deleted text := tbl || '_partition_deleted';
+  set_list text;
+  idx record;
+  start_id bigint := 0;
+  max_id bigint;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = tbl::regclass) = 'p' THEN
+    RAISE NOTICE '% is already partitioned', tbl;
+    RETURN;
+  END IF;
+
+  -- Start clean if an earlier attempt stopped half way.
+  EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_mirror', tbl);
+  EXECUTE format('DROP TABLE IF EXISTS %I CASCADE', part);
+  EXECUTE format('DROP TABLE IF EXISTS %I', deleted);
+
+  EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY HASH (seed)', part, tbl);
+  FOR i IN 0..partitions - 1 LOOP
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+      tbl || '_p' || i, part, partitions, i
+    );
+  END LOOP;
+
+  -- The same indexes the unpartitioned table has (0002, 0004, 0005), built
+  -- while the new table is still empty. Unique keys must include seed.
+  EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (id, seed)', part, part || '_pkey');
+  FOR idx IN SELECT * FROM (VALUES
+    ('tuple_key', 'CREATE UNIQUE INDEX %I ON %I (seed, x, z, claimed_size)'),
+    ('unchecked_idx', 'CREATE INDEX %I ON %I (claimed_size DESC) WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL)'),
+    ('leaderboard_idx', 'CREATE INDEX %I ON %I (calculated_size DESC, claimed_size DESC, id) WHERE calculated_size IS NOT NULL'),
+    ('island_idx', 'CREATE INDEX %I ON %I (seed) INCLUDE (min_x, max_x, min_z, max_z, calculated_size) WHERE calculated_size IS NOT NULL'),
+    ('user_backlog_size_idx', 'CREATE INDEX %I ON %I (user_id, claimed_size DESC) WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL)'),
+    ('user_backlog_age_idx', 'CREATE INDEX %I ON %I (user_id, id) WHERE calculated_size IS NULL AND (manual_check_needed = 0 OR manual_check_needed IS NULL)')
+  ) AS t(suffix, ddl) LOOP
+    EXECUTE format(idx.ddl, part || '_' || idx.suffix, part);
+  END LOOP;
+
+  -- Mirror writes made while we copy. Upserting makes the trigger and the
+  -- copy safe in either order: whichever commits second keeps the newest row.
+  -- A delete can't be ordered that way, so its id is also recorded and
+  -- checked again at the swap.
+  EXECUTE format('CREATE TABLE %I (id bigint PRIMARY KEY)', deleted);
+  SELECT string_agg(format('%I = excluded.%I', attname, attname), ', ' ORDER BY attnum)
+    INTO set_list
+    FROM pg_attribute
+    WHERE attrelid = tbl::regclass AND attnum > 0 AND NOT attisdropped;
+  EXECUTE format($f$
+    CREATE OR REPLACE FUNCTION %I() RETURNS trigger LANGUAGE plpgsql AS $body$
+    BEGIN
+      IF TG_OP = 'DELETE' THEN
+        DELETE FROM %I WHERE id = OLD.id AND seed = OLD.seed;
+        INSERT INTO %I VALUES (OLD.id) ON CONFLICT DO NOTHING;
+      ELSE
+        INSERT INTO %I SELECT (NEW).* ON CONFLICT (id, seed) DO UPDATE SET %s;
+      END IF;
+      RETURN NULL;
+    END;
+    $body$
+  $f$, tbl || '_mirror', part, deleted, part, set_list);
+  EXECUTE format(
+    'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I FOR EACH ROW EXECUTE FUNCTION %I()',
+    tbl || '_mirror', tbl, tbl || '_mirror'
+  );
+  COMMIT;
+
+  -- Copy what existed before the trigger, one committed id range at a time.
+  EXECUTE format('SELECT max(id) FROM %I', tbl) INTO max_id;
+  WHILE start_id < coalesce(max_id, 0) LOOP
+    EXECUTE format(
+      'INSERT INTO %I SELECT * FROM %I WHERE id > $1 AND id <= $2 ON CONFLICT DO NOTHING',
+      part, tbl
+    ) USING start_id, start_id + batch;
+    start_id := start_id + batch;
+    COMMIT;
+  END LOOP;
+
+  -- Swap. A delete racing an uncommitted batch copy could have left a row
+  -- behind; while writes are blocked, only the ids deleted during the copy
+  -- are looked at again. Waiting for the lock would queue every reader and
+  -- writer of the table behind us, so each attempt gives up after
+  -- lock_timeout, undoes itself and tries again a moment later.
+  LOOP
+    BEGIN
+      PERFORM set_config('lock_timeout', '2s', true);
+      EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', tbl);
+      EXECUTE format(
+        'DELETE FROM %I p USING %I d WHERE p.id = d.id AND NOT EXISTS (SELECT 1 FROM %I o WHERE o.id = p.id)',
+        part, deleted, tbl
+      );
+      EXECUTE format('DROP TRIGGER %I ON %I', tbl || '_mirror', tbl);
+      EXECUTE format('DROP FUNCTION %I()', tbl || '_mirror');
+      EXECUTE format('DROP TABLE %I', deleted);
+      EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, old);
+      EXECUTE format('ALTER TABLE %I RENAME TO %I', part, tbl);
+      FOR idx IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = old::regclass
+      LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.relname, replace(idx.relname, tbl, old));
+      END LOOP;
+      FOR idx IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = tbl::regclass
+      LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.relname, replace(idx.relname, part, tbl));
+      END LOOP;
+      -- Both tables draw ids from the original sequence; keep it when the old
+      -- table is dropped.
+      EXECUTE format('ALTER SEQUENCE %I OWNED BY %I.id', tbl || '_id_seq', tbl);
+      EXIT;
+    EXCEPTION WHEN lock_not_available THEN
+      RAISE NOTICE 'Waiting for a lock on %, retrying the swap', tbl;
+    END;
+    COMMIT;
+    PERFORM pg_sleep(1);
+  END LOOP;
+  COMMIT;
+END;
+$$;
+
+CALL partition_result_table('small_biomes', 16, 100000);
+CALL partition_result_table('large_biomes', 16, 100000);
+DROP PROCEDURE partition_result_table(text, int, int);
@@ -0,0 +1,54 @@
+-- Cold storage for checked results that fell far below the leaderboard. The
+-- checker's compactor moves them here out of the hot tables; ingest still
+-- dedups against them and /result falls back to them.
+--
+-- Rows are written once and never updated, so pages are packed full and
+-- autovacuum only needs to freeze them. Only the indexes dedup, island
+-- lookups and /result need are kept.
+CREATE TABLE IF NOT EXISTS small_biomes_archive (
+  id INT PRIMARY KEY,
+  seed BIGINT NOT NULL,
+  x INT NOT NULL,
+  z INT NOT NULL,
+  claimed_size INT NOT NULL,
+  calculated_size INT NOT NULL,
+  duplicate_seed_flag INT,
+  manual_check_needed INT,
+  user_id INT NOT NULL,
+  created_at timestamptz NOT NULL,
+  min_x INT,
+  min_z INT,
+  max_x INT,
+  max_z INT,
+  measured_from_cache BOOLEAN,
+  archived_at timestamptz NOT NULL default now()
+) WITH (fillfactor = 100);
+
+CREATE TABLE IF NOT EXISTS large_biomes_archive (
+  id INT PRIMARY KEY,
+  seed BIGINT NOT NULL,
+  x INT NOT NULL,
+  z INT NOT NULL,
+  claimed_size INT NOT NULL,
+  calculated_size INT NOT NULL,
+  duplicate_seed_flag INT,
+  manual_check_needed INT,
+  user_id INT NOT NULL,
+  created_at timestamptz NOT NULL,
+  min_x INT,
+  min_z INT,
+  max_x INT,
+  max_z INT,
+  measured_from_cache BOOLEAN,
+  archived_at timestamptz NOT NULL default now()
+) WITH (fillfactor = 100);
+
+CREATE UNIQUE INDEX IF NOT EXISTS small_biomes_archive_tuple_key
+  ON small_biomes_archive (seed, x, z, claimed_size) WITH (fillfactor = 100);
+CREATE UNIQUE INDEX IF NOT EXISTS large_biomes_archive_tuple_key
+  ON large_biomes_archive (seed, x, z, claimed_size) WITH (fillfactor = 100);
+
+CREATE INDEX IF NOT EXISTS small_biomes_archive_island_idx
+  ON small_biomes_archive (seed) INCLUDE (min_x, max_x, min_z, max_z, calculated_size);
+CREATE INDEX IF NOT EXISTS large_biomes_archive_island_idx
+  ON large_biomes_archive (seed) INCLUDE (min_x, max_x, min_z, max_z, calculated_size);
@@ -0,0 +1,16 @@
+-- One narrow row per finished check, written by the checker alongside the
+-- result. Lets Grafana (Postgres data source) chart sizeCheck runtimes,
+-- throughput and cache/manual rates over any period. Append-only and
+-- inserted in time order, so a BRIN index on finished_at is enough; old rows
+-- can be deleted by time range whenever the table gets too big.
+CREATE TABLE IF NOT EXISTS checker_jobs (
+  finished_at timestamptz NOT NULL default now(),
+  result_id INT NOT NULL,
+  large_biomes BOOLEAN NOT NULL,
+  runtime_ms INT,            -- sizeCheck wall time, NULL when answered from the island cache
+  cached BOOLEAN NOT NULL,
+  sized BOOLEAN NOT NULL,    -- the row was given a size
+  manual BOOLEAN NOT NULL    -- flagged for a manual check, including containment conflicts
+);
+
+CREATE INDEX IF NOT EXISTS checker_jobs_finished_idx ON checker_jobs USING brin (finished_at);
@@ -0,0 +1,45 @@
+-- Index measured islands as (seed, bounding box) with GiST so the checker's
+-- "is this island already covered" and "is this point inside a known island"
+-- tests are index searches on the box itself, however many islands a seed
+-- has. Replaces the btree island_idx from 0004. btree_gist lets seed
+-- equality share the GiST index with the box.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Partitioned tables can't build an index concurrently in one go: create it on
+-- the parent only, build each partition's concurrently, then attach them.
+CREATE INDEX IF NOT EXISTS small_biomes_island_box_idx ON ONLY small_biomes
+  USING gist (seed, box(point(min_x, min_z), point(max_x, max_z)))
+  WHERE calculated_size IS NOT NULL;
+CREATE INDEX IF NOT EXISTS large_biomes_island_box_idx ON ONLY large_biomes
+  USING gist (seed, box(point(min_x, min_z), point(max_x, max_z)))
+  WHERE calculated_size IS NOT NULL;
+
+SELECT format(
+  'CREATE INDEX CONCURRENTLY IF NOT EXISTS %I ON %I USING gist (seed, box(point(min_x, min_z), point(max_x, max_z))) WHERE calculated_size IS NOT NULL',
+  c.relname || '_island_box_idx', c.relname
+)
+FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent IN ('small_biomes'::regclass, 'large_biomes'::regclass)
+ORDER BY c.relname
+\gexec
+
+SELECT format('ALTER INDEX %I ATTACH PARTITION %I', p.relname || '_island_box_idx', c.relname || '_island_box_idx')
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_class p ON p.oid = i.inhparent
+WHERE i.inhparent IN ('small_biomes'::regclass, 'large_biomes'::regclass)
+  AND NOT EXISTS (
+    SELECT 1 FROM pg_inherits a WHERE a.inhrelid = to_regclass(c.relname || '_island_box_idx')
+  )
+ORDER BY c.relname
+\gexec
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS small_biomes_archive_island_box_idx
+  ON small_biomes_archive USING gist (seed, box(point(min_x, min_z), point(max_x, max_z)));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS large_biomes_archive_island_box_idx
+  ON large_biomes_archive USING gist (seed, box(point(min_x, min_z), point(max_x, max_z)));
+
+DROP INDEX IF EXISTS small_biomes_island_idx;
+DROP INDEX IF EXISTS large_biomes_island_idx;
+DROP INDEX CONCURRENTLY IF EXISTS small_biomes_archive_island_idx;
+DROP INDEX CONCURRENTLY IF EXISTS large_biomes_archive_island_idx;
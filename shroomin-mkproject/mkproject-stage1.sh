@@ -1,2 +1,7 @@
-psql -h shroom-postgres -U ${SHROOM_DB_USER} -c "CREATE DATABASE ${SHROOM_DB_NAME};"
-psql -h shroom-postgres -U ${SHROOM_DB_USER} -d ${SHROOM_DB_NAME} -f init.sql
+export PGHOST=shroom-postgres
+export PGUSER=${SHROOM_DB_USER}
+
+if [ "$(psql -tAc "SELECT 1 FROM pg_database WHERE datname = '${SHROOM_DB_NAME}'")" != "1" ]; then
+    psql -c "CREATE DATABASE ${SHROOM_DB_NAME};"
+fi
+sh migrate.sh